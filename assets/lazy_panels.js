@@ -0,0 +1,49 @@
+// Lazy layout (DASHBOARD_LAZY_LAYOUT=1): each .lazy-panel wraps a graph and a
+// "<graph id>-visible" store. The store is set the first time the panel
+// scrolls into view, which triggers the callback computing the graph.
+(function () {
+    var observed = new WeakSet();
+
+    function storeId(panel) {
+        return panel.id.replace(/-panel$/, "-visible");
+    }
+
+    function reveal(panel) {
+        if (window.dash_clientside && window.dash_clientside.set_props) {
+            window.dash_clientside.set_props(storeId(panel), {data: true});
+        }
+    }
+
+    var visibility = null;
+    if ("IntersectionObserver" in window) {
+        visibility = new IntersectionObserver(function (entries) {
+            entries.forEach(function (entry) {
+                if (entry.isIntersecting) {
+                    visibility.unobserve(entry.target);
+                    reveal(entry.target);
+                }
+            });
+        }, {rootMargin: "100px"});
+    }
+
+    // Panels are rendered by Dash after the page loads, watch for them
+    function watchPanels() {
+        document.querySelectorAll(".lazy-panel").forEach(function (panel) {
+            if (observed.has(panel)) {
+                return;
+            }
+            observed.add(panel);
+
+            if (visibility) {
+                visibility.observe(panel);
+            } else {
+                reveal(panel);
+            }
+        });
+    }
+
+    new MutationObserver(watchPanels).observe(document.documentElement, {
+        childList: true,
+        subtree: true,
+    });
+})();
@@ -0,0 +1,200 @@
+# Benchmark of the chart pipeline on synthetic datasets of growing size.
+# Every size runs in its own process (so peak RSS is per size) and reports the
+# load times, the time and serialized size of the KPIs and of each panel
+# (figure cache cleared before every call) and the peak RSS.
+#
+#   python -m benchmarks.run_benchmarks --rows 100000 1000000 --json out.json
+import argparse
+import functools
+import importlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# (name, panel of chart_utils.CHARTS or None for the KPIs, stroke value,
+# cross-filters) of the timed callbacks
+CALLBACKS = [
+    ("kpis", None, None, {}),
+    ("gender-pie-chart", "gender-pie-chart", "Yes", {}),
+    ("residence-pie-chart", "residence-pie-chart", "Yes", {}),
+    ("agebar-chart", "agebar-chart", "Yes", {}),
+    ("stroke-positive-smoker-chart", "stroke-positive-smoker-chart", "Yes", {}),
+    ("job-tree-chart", "job-tree-chart", "Yes", {}),
+    ("glucose-bar-chart", "glucose-bar-chart", None, {}),
+    ("bmi-bar-chart", "bmi-bar-chart", None, {}),
+    ("agebar-chart (filtered)", "agebar-chart", "Yes", {"gender": ["Female"]}),
+    (
+        "glucose-bar-chart (filtered)",
+        "glucose-bar-chart",
+        None,
+        {"gender": ["Female"]},
+    ),
+]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def timed(func, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    return result, {"min": min(times), "median": statistics.median(times)}
+
+
+def payload_size(result):
+    from plotly.utils import PlotlyJSONEncoder
+
+    return len(json.dumps(result, cls=PlotlyJSONEncoder))
+
+
+# Benchmark of one csv file, in the current process (configured through the
+# DASHBOARD_* variables set by run_size)
+def run_csv(csv_path, cache_dir, repeat):
+    from functions import data_utils
+
+    results = {"rows": None, "stages": {}, "callbacks": {}}
+
+    dataset, results["stages"]["load csv"] = timed(
+        lambda: data_utils.load_csv_dataset(csv_path, cache_dir=None), 1
+    )
+    results["rows"] = len(dataset)
+    del dataset
+
+    _, results["stages"]["build cache"] = timed(
+        lambda: data_utils.load_csv_dataset(csv_path, cache_dir), 1
+    )
+    _, results["stages"]["load cache"] = timed(
+        lambda: data_utils.load_csv_dataset(csv_path, cache_dir), repeat
+    )
+
+    # Loads the dataset, the aggregate cube and the bitmap indexes
+    chart_utils, results["stages"]["start dashboard"] = timed(
+        lambda: importlib.import_module("functions.chart_utils"), 1
+    )
+
+    _, results["stages"]["fetch_selected_data"] = timed(
+        data_utils.fetch_selected_data, repeat
+    )
+
+    for name, graph_id, value, filters in CALLBACKS:
+        if graph_id is None:
+            update = functools.partial(chart_utils.update_kpis_chart, None, filters)
+        else:
+            update = functools.partial(
+                chart_utils.update_panel, graph_id, value, filters=filters
+            )
+        result, timing = timed(update, repeat, chart_utils.figure_cache.clear)
+        timing["bytes"] = payload_size(result)
+        results["callbacks"][name] = timing
+
+    _, results["callbacks"]["snapshot"] = timed(
+        lambda: chart_utils.compute_snapshot("Yes", "Yes", "Yes", "Yes", "Yes"),
+        repeat,
+        chart_utils.figure_cache.clear,
+    )
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+# Generate a synthetic csv with n_rows and benchmark it in a child process
+def run_size(n_rows, repeat, seed, workdir):
+    from functions import data_utils
+    from functions.synthetic_utils import SyntheticStrokeData
+
+    csv_path = os.path.join(workdir, f"stroke_{n_rows}.csv")
+    cache_dir = os.path.join(workdir, f"cache_{n_rows}")
+    source = data_utils.load_csv_dataset(cache_dir=None)
+    SyntheticStrokeData(source, seed).write_csv(csv_path, n_rows)
+
+    env = dict(
+        os.environ,
+        DASHBOARD_DATA_BACKEND="csv",
+        DASHBOARD_QUERY_MODE="memory",
+        DASHBOARD_CSV_PATH=csv_path,
+        DASHBOARD_CACHE_DIR=cache_dir,
+    )
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.run_benchmarks",
+            "--csv",
+            csv_path,
+            "--cache-dir",
+            cache_dir,
+            "--repeat",
+            str(repeat),
+        ],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def print_results(results):
+    print(f"\n{results['rows']:,} rows (peak RSS {results['peak_rss_mb']:.0f} MB)")
+    print(f"  {'stage / callback':<32}{'min ms':>10}{'median ms':>11}{'bytes':>10}")
+    for section in ("stages", "callbacks"):
+        for name, timing in results[section].items():
+            size = timing.get("bytes", "")
+            print(
+                f"  {name:<32}{timing['min'] * 1000:>10.2f}"
+                f"{timing['median'] * 1000:>11.2f}{size:>10}"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the chart pipeline")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--workdir", help="keep the generated files here")
+    # Internal: benchmark one existing csv file and print the results as json
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    parser.add_argument("--cache-dir", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.csv:
+        print(json.dumps(run_csv(args.csv, args.cache_dir, args.repeat)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workdir = args.workdir or tmp_dir
+        os.makedirs(workdir, exist_ok=True)
+
+        all_results = []
+        for n_rows in args.rows:
+            results = run_size(n_rows, args.repeat, args.seed, workdir)
+            print_results(results)
+            all_results.append(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(all_results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,309 +1,451 @@
 # Import necessary libraries
+import hmac
+import json
+
 from dash import Dash, dcc, html, Input, Output, callback
+from flask import request
+from plotly.utils import PlotlyJSONEncoder
 
 # Import data and chart generation functions
-from functions import data_utils
+from functions import (
+    chart_utils,
+    config,
+    db_utils,
+    http_utils,
+    job_utils,
+    kpi_utils,
+    metrics_utils,
+    reload_utils,
+)
 
-from functions import chart_utils
+# Initialize Dash app (expensive panels optionally run as background callbacks)
+background_callback_manager = None
+if config.BACKGROUND_CALLBACKS:
+    background_callback_manager = job_utils.background_callback_manager(
+        config.BACKGROUND_DIR
+    )
 
-# Fetch the data and headers
-data, headers = data_utils.fetch_selected_data()
+app = Dash(__name__, background_callback_manager=background_callback_manager)
 
-# Initialize Dash app
-app = Dash(__name__)
+# WSGI entry point (e.g. gunicorn dash_app:server, or python serve.py)
+server = app.server
 
-# Define layout
-app.layout = html.Div(
-    [
-        # Dashboard title
-        html.H1(
-            "Stroke patients at a glance",
-            style={
-                "textAlign": "center",
-                "marginBottom": "15px",
-                "fontSize": "48px",
-                "fontFamily": "Arial, sans-serif",
-                "fontWeight": "700",
-                "color": "#2c3e50",
-            },
-        ),
-        # Brief summary
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.Div("Total patients", className="kpi-title"),
-                        html.Div(id="kpi-total", className="kpi-value"),
-                    ],
-                    className="kpi-card kpi-generic",
-                ),
-                html.Div(
-                    [
-                        html.Div("Healthy", className="kpi-title"),
-                        html.Div(id="kpi-no-stroke", className="kpi-value"),
-                    ],
-                    className="kpi-card kpi-no-stroke",
-                ),
-                html.Div(
-                    [
-                        html.Div("Stroke", className="kpi-title"),
-                        html.Div(id="kpi-stroke", className="kpi-value"),
-                    ],
-                    className="kpi-card kpi-stroke",
-                ),
-            ],
-            className="kpi-container",
-        ),
-        # Row 1 – two large plots
-        html.Div(
-            [
-                html.Div(
-                    [
-                        dcc.Graph(
-                            id="gender-pie-chart", style={"marginBottom": "-60px"}
-                        ),
-                        html.P(
-                            "Stroke:",
-                            style={
-                                "textAlign": "left",
-                                "marginBottom": "-28px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "paddingLeft": "150px",
-                                "position": "relative",
-                                "zIndex": 1000,
-                            },
-                        ),
-                        dcc.Dropdown(
-                            id="gender_stroke_val",
-                            options=[
-                                "Yes",
-                                "No",
-                            ],
-                            value="No",  # default selection
-                            clearable=False,
-                            style={
-                                "textAlign": "center",
-                                "marginBottom": "5px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "width": "30%",
-                                "display": "flex",
-                                "margin": "0 auto",
-                                "position": "relative",
-                                "zIndex": 1000,
-                                "paddingLeft": "140px",
-                            },
-                        ),
-                    ]
-                ),
-                html.Div(
-                    [
-                        dcc.Graph(
-                            id="residence-pie-chart", style={"marginBottom": "-60px"}
-                        ),
-                        html.P(
-                            "Stroke:",
-                            style={
-                                "textAlign": "left",
-                                "marginBottom": "-28px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "paddingLeft": "150px",
-                                "position": "relative",
-                                "zIndex": 1000,
-                            },
-                        ),
-                        dcc.Dropdown(
-                            id="residence_stroke_val",
-                            options=[
-                                "Yes",
-                                "No",
-                            ],
-                            value="No",  # default selection
-                            clearable=False,
-                            style={
-                                "textAlign": "center",
-                                "marginBottom": "5px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "width": "30%",
-                                "display": "flex",
-                                "margin": "0 auto",
-                                "position": "relative",
-                                "zIndex": 1000,
-                                "paddingLeft": "140px",
-                            },
-                        ),
-                    ]
-                ),
-                html.Div(
-                    [
-                        dcc.Graph(id="agebar-chart", style={"marginBottom": "-50px"}),
-                        html.P(
-                            "Stroke:",
-                            style={
-                                "textAlign": "left",
-                                "marginBottom": "-28px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "paddingLeft": "480px",
-                                "position": "relative",
-                                "zIndex": 1000,
-                            },
-                        ),
-                        dcc.Dropdown(
-                            id="age_stroke_val",
-                            options=[
-                                "Yes",
-                                "No",
-                            ],
-                            value="No",  # default selection
-                            clearable=False,
-                            style={
-                                "textAlign": "center",
-                                "marginBottom": "5px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "width": "20%",
-                                "display": "flex",
-                                "margin": "0 auto",
-                                "position": "relative",
-                                "paddingLeft": "500px",
-                                "zIndex": 1000,
-                            },
-                        ),
-                    ]
-                ),
-            ],
-            style={
-                "display": "grid",
-                "gridTemplateColumns": "1fr 1fr 1fr",
-                "gap": "0px",
-            },
-        ),
-        # Row 2 – three smaller plots
-        html.Div(
-            [
-                html.Div(
-                    [
-                        dcc.Graph(
-                            id="stroke-positive-smoker-chart",
-                            style={"marginBottom": "-60px"},
-                        ),
-                        html.P(
-                            "Stroke:",
-                            style={
-                                "textAlign": "left",
-                                "marginBottom": "-28px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "paddingLeft": "135px",
-                                "position": "relative",
-                                "zIndex": 1000,
-                            },
-                        ),
-                        dcc.Dropdown(
-                            id="smoker_stroke_val",
-                            options=[
-                                "Yes",
-                                "No",
-                            ],
-                            value="No",  # default selection
-                            clearable=False,
-                            style={
-                                "textAlign": "center",
-                                "marginBottom": "5px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "width": "30%",
-                                "display": "flex",
-                                "margin": "0 auto",
-                                "position": "relative",
-                                "zIndex": 1000,
-                                "paddingLeft": "180px",
-                            },
-                        ),
-                    ]
-                ),
-                html.Div(
-                    [
-                        dcc.Graph(
-                            id="job-tree-chart",
-                            style={"marginBottom": "-60px", "paddingLeft": "20px"},
-                        ),
-                        html.P(
-                            "Stroke:",
-                            style={
-                                "textAlign": "left",
-                                "marginBottom": "-28px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "paddingLeft": "190px",
-                                "position": "relative",
-                                "zIndex": 1000,
-                            },
-                        ),
-                        dcc.Dropdown(
-                            id="job_stroke_val",
-                            options=[
-                                "Yes",
-                                "No",
-                            ],
-                            value="No",  # default selection
-                            clearable=False,
-                            style={
-                                "textAlign": "center",
-                                "marginBottom": "5px",
-                                "fontSize": "18px",
-                                "fontFamily": "Arial, sans-serif",
-                                "fontWeight": "700",
-                                "color": "#2c3e50",
-                                "width": "30%",
-                                "display": "flex",
-                                "margin": "0 auto",
-                                "position": "relative",
-                                "zIndex": 1000,
-                                "paddingLeft": "300px",
-                            },
-                        ),
-                    ]
-                ),
-                dcc.Graph(id="glucose-bar-chart"),
-                dcc.Graph(id="bmi-bar-chart"),
+
+# In lazy mode a graph is only computed once it scrolls into view (see
+# assets/lazy_panels.js), with a loading placeholder until then
+def lazy_panel(graph):
+    if not config.LAZY_LAYOUT:
+        return graph
+
+    return html.Div(
+        [dcc.Store(id=f"{graph.id}-visible"), dcc.Loading(graph, type="circle")],
+        id=f"{graph.id}-panel",
+        className="lazy-panel",
+    )
+
+
+# Define layout (built per page load: in lazy mode the KPIs are embedded in it
+# instead of waiting for a callback)
+def serve_layout():
+    kpis = [None] * len(config.KPIS)
+    if config.LAZY_LAYOUT:
+        kpis = chart_utils.update_kpis_chart(None)
+
+    return html.Div(
+        id="dashboard",
+        children=[
+            # Dashboard title
+            html.H1(
+                "Stroke patients at a glance",
+                style={
+                    "textAlign": "center",
+                    "marginBottom": "15px",
+                    "fontSize": "48px",
+                    "fontFamily": "Arial, sans-serif",
+                    "fontWeight": "700",
+                    "color": "#2c3e50",
+                },
+            ),
+            # Brief summary (cards of the configured KPIs)
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Div(
+                                kpi_utils.KPIS[kpi_id].title, className="kpi-title"
+                            ),
+                            html.Div(value, id=kpi_id, className="kpi-value"),
+                        ],
+                        className=f"kpi-card {kpi_utils.KPIS[kpi_id].class_name}",
+                    )
+                    for kpi_id, value in zip(config.KPIS, kpis)
+                ],
+                className="kpi-container",
+            ),
+            # Version of the dataset, polled to refresh the KPIs and charts after
+            # new data
+            dcc.Store(id="data-version", data=chart_utils.current().version),
+            dcc.Interval(
+                id="data-version-interval",
+                interval=max(config.KPI_REFRESH_SECONDS, 1) * 1000,
+                disabled=config.KPI_REFRESH_SECONDS == 0,
+            ),
+            # Cross-filters selected by clicking the pie and treemap charts
+            dcc.Store(id="cross-filter", data={}),
+            # Requests of the exact figures of the approximate panels
+            *[
+                dcc.Store(id=f"{graph_id}-exact")
+                for graph_id in chart_utils.CHARTS
+                if chart_utils.approximate(graph_id)
             ],
-            style={
-                "display": "grid",
-                "gridTemplateColumns": "1fr 1fr 1fr 1fr",
-                "gap": "0px",
-                "marginTop": "10px",
-            },
-        ),
-    ]
-)
+            html.Div(
+                [
+                    html.Span(id="cross-filter-summary"),
+                    html.Button(
+                        "Clear filters",
+                        id="clear-cross-filter",
+                        className="cross-filter-clear",
+                    ),
+                ],
+                className="cross-filter-bar",
+            ),
+            # Row 1 – two large plots
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            lazy_panel(
+                                dcc.Graph(
+                                    id="gender-pie-chart",
+                                    style={"marginBottom": "-60px"},
+                                )
+                            ),
+                            html.P(
+                                "Stroke:",
+                                style={
+                                    "textAlign": "left",
+                                    "marginBottom": "-28px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "paddingLeft": "150px",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                },
+                            ),
+                            dcc.Dropdown(
+                                id="gender_stroke_val",
+                                options=[
+                                    "Yes",
+                                    "No",
+                                ],
+                                value="No",  # default selection
+                                clearable=False,
+                                style={
+                                    "textAlign": "center",
+                                    "marginBottom": "5px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "width": "30%",
+                                    "display": "flex",
+                                    "margin": "0 auto",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                    "paddingLeft": "140px",
+                                },
+                            ),
+                        ]
+                    ),
+                    html.Div(
+                        [
+                            lazy_panel(
+                                dcc.Graph(
+                                    id="residence-pie-chart",
+                                    style={"marginBottom": "-60px"},
+                                )
+                            ),
+                            html.P(
+                                "Stroke:",
+                                style={
+                                    "textAlign": "left",
+                                    "marginBottom": "-28px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "paddingLeft": "150px",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                },
+                            ),
+                            dcc.Dropdown(
+                                id="residence_stroke_val",
+                                options=[
+                                    "Yes",
+                                    "No",
+                                ],
+                                value="No",  # default selection
+                                clearable=False,
+                                style={
+                                    "textAlign": "center",
+                                    "marginBottom": "5px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "width": "30%",
+                                    "display": "flex",
+                                    "margin": "0 auto",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                    "paddingLeft": "140px",
+                                },
+                            ),
+                        ]
+                    ),
+                    html.Div(
+                        [
+                            lazy_panel(
+                                dcc.Graph(
+                                    id="agebar-chart", style={"marginBottom": "-50px"}
+                                )
+                            ),
+                            html.P(
+                                "Stroke:",
+                                style={
+                                    "textAlign": "left",
+                                    "marginBottom": "-28px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "paddingLeft": "480px",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                },
+                            ),
+                            dcc.Dropdown(
+                                id="age_stroke_val",
+                                options=[
+                                    "Yes",
+                                    "No",
+                                ],
+                                value="No",  # default selection
+                                clearable=False,
+                                style={
+                                    "textAlign": "center",
+                                    "marginBottom": "5px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "width": "20%",
+                                    "display": "flex",
+                                    "margin": "0 auto",
+                                    "position": "relative",
+                                    "paddingLeft": "500px",
+                                    "zIndex": 1000,
+                                },
+                            ),
+                        ]
+                    ),
+                ],
+                style={
+                    "display": "grid",
+                    "gridTemplateColumns": "1fr 1fr 1fr",
+                    "gap": "0px",
+                },
+            ),
+            # Row 2 – three smaller plots
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            lazy_panel(
+                                dcc.Graph(
+                                    id="stroke-positive-smoker-chart",
+                                    style={"marginBottom": "-60px"},
+                                )
+                            ),
+                            html.P(
+                                "Stroke:",
+                                style={
+                                    "textAlign": "left",
+                                    "marginBottom": "-28px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "paddingLeft": "135px",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                },
+                            ),
+                            dcc.Dropdown(
+                                id="smoker_stroke_val",
+                                options=[
+                                    "Yes",
+                                    "No",
+                                ],
+                                value="No",  # default selection
+                                clearable=False,
+                                style={
+                                    "textAlign": "center",
+                                    "marginBottom": "5px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "width": "30%",
+                                    "display": "flex",
+                                    "margin": "0 auto",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                    "paddingLeft": "180px",
+                                },
+                            ),
+                        ]
+                    ),
+                    html.Div(
+                        [
+                            lazy_panel(
+                                dcc.Graph(
+                                    id="job-tree-chart",
+                                    style={
+                                        "marginBottom": "-60px",
+                                        "paddingLeft": "20px",
+                                    },
+                                )
+                            ),
+                            html.P(
+                                "Stroke:",
+                                style={
+                                    "textAlign": "left",
+                                    "marginBottom": "-28px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "paddingLeft": "190px",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                },
+                            ),
+                            dcc.Dropdown(
+                                id="job_stroke_val",
+                                options=[
+                                    "Yes",
+                                    "No",
+                                ],
+                                value="No",  # default selection
+                                clearable=False,
+                                style={
+                                    "textAlign": "center",
+                                    "marginBottom": "5px",
+                                    "fontSize": "18px",
+                                    "fontFamily": "Arial, sans-serif",
+                                    "fontWeight": "700",
+                                    "color": "#2c3e50",
+                                    "width": "30%",
+                                    "display": "flex",
+                                    "margin": "0 auto",
+                                    "position": "relative",
+                                    "zIndex": 1000,
+                                    "paddingLeft": "300px",
+                                },
+                            ),
+                        ]
+                    ),
+                    lazy_panel(dcc.Graph(id="glucose-bar-chart")),
+                    lazy_panel(dcc.Graph(id="bmi-bar-chart")),
+                ],
+                style={
+                    "display": "grid",
+                    "gridTemplateColumns": "1fr 1fr 1fr 1fr",
+                    "gap": "0px",
+                    "marginTop": "10px",
+                },
+            ),
+        ],
+    )
 
 
+app.layout = serve_layout
+
 # Define callback functions
 chart_utils.register_callbacks(app)
 
+# gzip/brotli compression of the responses
+http_utils.install(server)
+
+# Latency, payload and allocation histograms of the callbacks at /metrics.
+# Installed after the compression: Flask runs the after_request hooks in
+# reverse order, so the payloads are measured before they are compressed.
+metrics_utils.instrument(app, server)
+
+# Requests keep the version of the data they started with, while the dataset
+# manager reloads it in the background when the source changes
+reload_utils.install(server, chart_utils.datasets)
+
+
+# Append a batch of new patient rows (JSON list matching the stroke_data schema),
+# for clients holding the ingest token
+@server.route("/api/ingest", methods=["POST"])
+def ingest():
+    if not config.INGEST_TOKEN:
+        return {"error": "Ingest is disabled"}, 404
+
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(token.encode(), config.INGEST_TOKEN.encode()):
+        return {"error": "Invalid ingest token"}, 401
+
+    if config.WORKERS > 1:
+        return {"error": "Ingest needs a single serving process"}, 409
+
+    try:
+        count = chart_utils.ingest_rows(request.get_json(silent=True))
+    except (TypeError, ValueError) as error:
+        return {"error": str(error)}, 400
+    except db_utils.INTEGRITY_ERRORS as error:
+        return {"error": f"Rows conflict with the stored data: {error}"}, 409
+
+    return {"ingested": count, "version": chart_utils.datasets.snapshot.version}
+
+
+# Figure of one panel, e.g. /api/figures/agebar-chart?value=Yes&filters={...},
+# for clients outside of the dashboard (the page itself gets its figures from
+# the callbacks). Clients and proxies revalidate it with its ETag, which is
+# known without building the figure (304 until the data or the arguments
+# change).
+@server.route("/api/figures/<graph_id>")
+def figure(graph_id):
+    if graph_id not in chart_utils.CHARTS:
+        return {"error": f"Unknown chart: {graph_id}"}, 404
+
+    try:
+        filters = json.loads(request.args.get("filters", "{}"))
+        chart_utils.check_filters(filters)
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+    value = request.args.get("value")
+    etag = chart_utils.panel_etag(graph_id, value, filters)
+    if request.if_none_match.contains(etag):
+        response = server.response_class(status=304)
+    else:
+        figure = chart_utils.panel_figure(graph_id, value, filters)
+        response = server.response_class(
+            json.dumps(figure, cls=PlotlyJSONEncoder), mimetype="application/json"
+        )
+
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
 # Run the app
 if __name__ == "__main__":
     app.run(debug=True)
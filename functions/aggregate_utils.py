@@ -0,0 +1,394 @@
+# Import the necessary libraries
+import numpy as np
+
+from functions.category_utils import registry
+from functions.sketch_utils import QuantileSketch
+
+# Categorical columns the cube is keyed on (together with stroke)
+CUBE_DIMENSIONS = [
+    "gender",
+    "residence_type",
+    "smoking_status",
+    "work_type",
+    "hypertension",
+    "heart_disease",
+]
+
+# Age buckets used by the age bar chart (last one open-ended at 90+)
+AGE_BUCKET_WIDTH = 5
+AGE_BUCKET_WIDTHS = [1, 5, 10]
+AGE_BUCKET_CAP = 90
+
+# Numeric columns summarized by mergeable quantile sketches (box plots)
+SKETCH_COLUMNS = ["avg_glucose_level", "bmi"]
+
+
+# Count every (row code, column code) pair in a single bincount pass
+def crosstab(row_codes, col_codes, n_rows, n_cols):
+    flat = row_codes.astype(np.intp) * n_cols + col_codes
+    counts = np.bincount(flat, minlength=n_rows * n_cols)
+
+    return counts.reshape(n_rows, n_cols)
+
+
+# Zero-pad a 2D count table to a larger shape
+def pad_to(counts, shape):
+    return np.pad(
+        counts, [(0, shape[0] - counts.shape[0]), (0, shape[1] - counts.shape[1])]
+    )
+
+
+# Histograms of a numeric column for every class at once. Values are bucketed
+# once at a fine resolution, coarser bucket widths are derived by merging
+# neighbouring fine buckets instead of rescanning the column.
+class HistogramEngine:
+    def __init__(self, counts, resolution=1, start=0, cap=None):
+        self.counts = counts  # class x fine bucket
+        self.resolution = resolution
+        self.start = start
+        self.cap = cap
+        self._histograms = {}
+
+        # Regular fine buckets (the capped engine has one extra open-ended one)
+        self.n_regular = counts.shape[1] - (cap is not None)
+
+    @classmethod
+    def from_values(
+        cls, values, class_codes, n_classes, resolution=1, start=0, cap=None
+    ):
+        if cap is None:
+            top = values.max() if len(values) else start
+            n_fine = int((top - start) // resolution) + 1
+        else:
+            n_fine = int(round((cap - start) / resolution)) + 1
+
+        # Single pass: integer bucket codes, then one bincount for all classes
+        codes = np.floor_divide(values - start, resolution).astype(np.int64)
+        np.clip(codes, 0, n_fine - 1, out=codes)
+
+        return cls(
+            crosstab(class_codes, codes, n_classes, n_fine), resolution, start, cap
+        )
+
+    def merged(self, counts):
+        # New engine with extra counts added (missing rows/buckets padded)
+        shape = np.maximum(self.counts.shape, counts.shape)
+        return HistogramEngine(
+            pad_to(self.counts, shape) + pad_to(counts, shape),
+            self.resolution,
+            self.start,
+            self.cap,
+        )
+
+    def to_dict(self):
+        return {
+            "counts": self.counts.tolist(),
+            "resolution": self.resolution,
+            "start": self.start,
+            "cap": self.cap,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            np.array(data["counts"], dtype=np.int64, ndmin=2),
+            data["resolution"],
+            data["start"],
+            data["cap"],
+        )
+
+    def histogram(self, width):
+        if width not in self._histograms:
+            self._histograms[width] = self._merge(width)
+
+        return self._histograms[width]
+
+    def _merge(self, width):
+        step = int(round(width / self.resolution))
+        if step < 1 or not np.isclose(step * self.resolution, width):
+            raise ValueError(
+                f"Bucket width {width} is not a multiple of {self.resolution}"
+            )
+        if self.cap is not None and self.n_regular % step:
+            raise ValueError(f"Bucket width {width} does not divide the cap")
+
+        # Sum runs of `step` fine buckets (the open-ended bucket stays alone)
+        starts = np.arange(0, self.n_regular, step)
+        if self.cap is not None:
+            starts = np.append(starts, self.n_regular)
+        counts = np.add.reduceat(self.counts, starts, axis=1)
+
+        lows = self.start + starts * self.resolution
+        labels = [f"{low:g}-{low + width:g}" for low in lows]
+        if self.cap is not None:
+            labels[-1] = f"{self.cap:g}+"
+
+        return labels, counts
+
+
+# Group-by counts of stroke x (gender, residence, smoking, work, age group)
+class AggregateCube:
+    def __init__(
+        self,
+        stroke_categories,
+        categories,
+        counts,
+        age_histogram,
+        sketches=None,
+        version=1,
+    ):
+        self.stroke_categories = stroke_categories
+        self.categories = categories  # dimension -> list of labels
+        self.counts = counts  # dimension -> stroke x category counts
+        self.age_histogram = age_histogram
+        self.sketches = sketches or {}  # (column, stroke label) -> sketch
+        self.version = version
+
+        # Age histograms for every supported bucket width
+        for width in AGE_BUCKET_WIDTHS:
+            self.age_histogram.histogram(width)
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        stroke_codes = dataset.codes["stroke"]
+        n_stroke = len(dataset.categories["stroke"])
+        categories = {}
+        counts = {}
+
+        # Compute all group-by counts once at load time
+        for dimension in CUBE_DIMENSIONS:
+            categories[dimension] = list(dataset.categories[dimension])
+            counts[dimension] = crosstab(
+                stroke_codes,
+                dataset.codes[dimension],
+                n_stroke,
+                len(categories[dimension]),
+            )
+
+        age_histogram = HistogramEngine.from_values(
+            dataset.numeric["age"], stroke_codes, n_stroke, cap=AGE_BUCKET_CAP
+        )
+
+        return cls(
+            list(dataset.categories["stroke"]),
+            categories,
+            counts,
+            age_histogram,
+            cube_sketches(dataset),
+            version=dataset.version,
+        )
+
+    @classmethod
+    def from_group_counts(cls, rows, version=1):
+        # rows: (stroke, *CUBE_DIMENSIONS, age capped at AGE_BUCKET_CAP, count)
+        columns = ["stroke"] + CUBE_DIMENSIONS
+        table = list(zip(*rows)) or [()] * (len(columns) + 2)
+        categories = {
+            column: registry.categories(column, set(table[position]))
+            for position, column in enumerate(columns)
+        }
+        codes = {
+            column: np.array(
+                [categories[column].index(label) for label in table[position]],
+                dtype=np.intp,
+            )
+            for position, column in enumerate(columns)
+        }
+        ages = np.clip(np.array(table[-2], dtype=np.intp), 0, AGE_BUCKET_CAP)
+        group_counts = np.array(table[-1], dtype=np.int64)
+        n_stroke = len(categories["stroke"])
+
+        # Scatter the group counts onto every stroke x dimension table
+        counts = {}
+        for dimension in CUBE_DIMENSIONS:
+            counts[dimension] = np.zeros(
+                (n_stroke, len(categories[dimension])), dtype=np.int64
+            )
+            np.add.at(
+                counts[dimension], (codes["stroke"], codes[dimension]), group_counts
+            )
+
+        age_counts = np.zeros((n_stroke, AGE_BUCKET_CAP + 1), dtype=np.int64)
+        np.add.at(age_counts, (codes["stroke"], ages), group_counts)
+
+        return cls(
+            categories["stroke"],
+            {dimension: categories[dimension] for dimension in CUBE_DIMENSIONS},
+            counts,
+            HistogramEngine(age_counts, cap=AGE_BUCKET_CAP),
+            version=version,
+        )
+
+    # JSON-serializable form (e.g. precomputed by the ETL, see etl_utils)
+    def to_dict(self):
+        return {
+            "stroke_categories": self.stroke_categories,
+            "categories": self.categories,
+            "counts": {
+                dimension: counts.tolist() for dimension, counts in self.counts.items()
+            },
+            "age_histogram": self.age_histogram.to_dict(),
+            "sketches": [
+                {"column": column, "stroke": label, "sketch": sketch.to_dict()}
+                for (column, label), sketch in self.sketches.items()
+            ],
+            "version": self.version,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["stroke_categories"],
+            data["categories"],
+            {
+                dimension: np.array(counts, dtype=np.int64, ndmin=2)
+                for dimension, counts in data["counts"].items()
+            },
+            HistogramEngine.from_dict(data["age_histogram"]),
+            {
+                (entry["column"], entry["stroke"]): QuantileSketch.from_dict(
+                    entry["sketch"]
+                )
+                for entry in data["sketches"]
+            },
+            data["version"],
+        )
+
+    def _row(self, counts, stroke_value):
+        # Counts of one stroke class, zeros if the class is not in the data
+        if stroke_value not in self.stroke_categories:
+            return np.zeros(counts.shape[1], dtype=np.int64)
+
+        return counts[self.stroke_categories.index(stroke_value)]
+
+    def value_counts(self, dimension, stroke_value):
+        # Sort by descending count (like pandas value_counts) and drop empty ones
+        counts = self._row(self.counts[dimension], stroke_value)
+        order = np.argsort(-counts, kind="stable")
+        order = order[counts[order] > 0]
+
+        return [self.categories[dimension][i] for i in order], counts[order]
+
+    def age_group_counts(self, stroke_value, width=AGE_BUCKET_WIDTH):
+        # Keep the age group order and drop empty groups
+        labels, counts = self.age_histogram.histogram(width)
+        counts = self._row(counts, stroke_value)
+        observed = np.flatnonzero(counts)
+
+        return [labels[i] for i in observed], counts[observed]
+
+    def mean(self, column, stroke_value):
+        # Running sum and count kept by the sketch
+        sketch = self.sketches.get((column, stroke_value))
+        if sketch is None or sketch.count == 0:
+            return None
+
+        return sketch.sum / sketch.count
+
+    def box_stats(self, column, stroke_value):
+        sketch = self.sketches.get((column, stroke_value))
+        return sketch.box_stats() if sketch is not None else None
+
+    def append(self, batch):
+        # New cube with every count updated in O(batch) from a StrokeDataset of
+        # new rows. This cube is left as is: callbacks still reading it keep a
+        # consistent version.
+        stroke_categories = list(self.stroke_categories)
+        stroke_codes = extend_codes(stroke_categories, batch, "stroke")
+        n_stroke = len(stroke_categories)
+
+        categories = {}
+        counts = {}
+        for dimension in CUBE_DIMENSIONS:
+            categories[dimension] = list(self.categories[dimension])
+            codes = extend_codes(categories[dimension], batch, dimension)
+            shape = (n_stroke, len(categories[dimension]))
+            counts[dimension] = pad_to(self.counts[dimension], shape) + crosstab(
+                stroke_codes, codes, *shape
+            )
+
+        age_counts = HistogramEngine.from_values(
+            batch.numeric["age"], stroke_codes, n_stroke, cap=AGE_BUCKET_CAP
+        ).counts
+
+        sketches = dict(self.sketches)
+        for key, sketch in cube_sketches(batch).items():
+            if key in sketches:
+                sketches[key] = sketches[key].merged(sketch)
+            else:
+                sketches[key] = sketch
+
+        return AggregateCube(
+            stroke_categories,
+            categories,
+            counts,
+            self.age_histogram.merged(age_counts),
+            sketches,
+            self.version + 1,
+        )
+
+    def snapshot(self):
+        # Already a single precomputed pass over the data
+        return self
+
+    def stroke_counts(self):
+        by_label = dict(
+            zip(self.stroke_categories, self.counts["gender"].sum(axis=1).tolist())
+        )
+
+        return sum(by_label.values()), by_label.get("Yes", 0), by_label.get("No", 0)
+
+
+# Translate a batch's category codes into the cube's codes, adding new labels
+def extend_codes(categories, batch, column):
+    lookup = np.empty(len(batch.categories[column]), dtype=np.intp)
+    for code, label in enumerate(batch.categories[column]):
+        if label not in categories:
+            categories.append(label)
+        lookup[code] = categories.index(label)
+
+    return lookup[batch.codes[column]]
+
+
+# Quantile sketch of every summarized column for each stroke class
+def cube_sketches(dataset):
+    sketches = {}
+    for code, label in enumerate(dataset.categories["stroke"]):
+        mask = dataset.codes["stroke"] == code
+        for column in SKETCH_COLUMNS:
+            sketches[(column, label)] = QuantileSketch.from_values(
+                dataset.numeric[column][mask]
+            )
+
+    return sketches
+
+
+# Quartiles, Tukey whiskers, mean and a capped outlier sample of a numeric array
+def box_stats(values, max_outliers=100):
+    if len(values) == 0:
+        return None
+
+    # np.quantile uses partial sorting (introselect), no full sort needed
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+
+    # Whiskers end at the last data points inside 1.5 IQR
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    outliers = values[(values < inside.min()) | (values > inside.max())]
+
+    # Keep an evenly spaced sample of the outliers (extremes included)
+    outliers = np.sort(outliers)
+    if len(outliers) > max_outliers:
+        keep = np.linspace(0, len(outliers) - 1, max_outliers).round().astype(int)
+        outliers = outliers[keep]
+
+    return {
+        "q1": float(q1),
+        "median": float(median),
+        "q3": float(q3),
+        "lowerfence": float(inside.min()),
+        "upperfence": float(inside.max()),
+        "mean": float(values.mean()),
+        "outliers": outliers,
+        "count": len(values),
+    }
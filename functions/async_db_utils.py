@@ -0,0 +1,207 @@
+# Import the necessary libraries
+import argparse
+import asyncio
+import itertools
+import re
+import threading
+import time
+
+try:
+    import asyncpg
+except ImportError:  # blocking backends run on worker threads instead
+    asyncpg = None
+
+from functions import config, db_utils
+from functions.aggregate_utils import AGE_BUCKET_WIDTH
+from functions.spec_utils import CHARTS
+from functions.sql_utils import SqlAggregates
+
+
+# Number the {p} placeholders of a query ($1, $2, ...) for asyncpg
+def numbered_placeholders(sql):
+    numbers = itertools.count(1)
+    return re.sub(r"\{p\}", lambda match: f"${next(numbers)}", sql)
+
+
+# PostgreSQL through an asyncpg pool: queries wait on the socket instead of
+# holding a thread each
+class AsyncPostgresBackend:
+    dialect = "postgres"
+
+    def __init__(
+        self,
+        params=None,
+        table=config.POSTGRES_TABLE,
+        min_connections=config.DB_MIN_CONNECTIONS,
+        max_connections=config.DB_MAX_CONNECTIONS,
+    ):
+        if asyncpg is None:
+            raise ImportError("asyncpg is required for the async postgres backend")
+
+        self.params = params or config.POSTGRES
+        self.table = table
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def pool(self):
+        # Created on first use, in the event loop running the queries
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(
+                    database=self.params["dbname"],
+                    user=self.params["user"],
+                    password=self.params["password"] or None,
+                    host=self.params["host"],
+                    port=int(self.params["port"]),
+                    min_size=self.min_connections,
+                    max_size=self.max_connections,
+                )
+
+        return self._pool
+
+    async def query(self, sql, params=()):
+        pool = await self.pool()
+        rows = await pool.fetch(numbered_placeholders(sql), *params)
+        return [tuple(row) for row in rows]
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+
+
+# Blocking backend (SQLite, or psycopg2 without asyncpg) behind the same
+# interface: each query runs on a worker thread of the event loop
+class ThreadedBackend:
+    def __init__(self, backend):
+        self.backend = backend
+        self.table = backend.table
+        self.dialect = backend.dialect
+
+    async def query(self, sql, params=()):
+        return await asyncio.to_thread(
+            self.backend.query, sql.format(p=self.backend.placeholder), params
+        )
+
+    async def close(self):
+        pass
+
+
+# The aggregate plans of SqlAggregates, awaited on an asyncio backend
+class AsyncSqlAggregates(SqlAggregates):
+    async def _run(self, plan):
+        rows = None
+        while True:
+            try:
+                sql, params = plan.send(rows)
+            except StopIteration as done:
+                return done.value
+            rows = await self.backend.query(sql, params)
+
+
+# Results of the queries of every panel, with the interface of the cube
+class PanelResults:
+    def __init__(self, results):
+        self.results = results  # (aggregate, args) -> result
+
+    def value_counts(self, column, stroke_value):
+        return self.results[("value_counts", (column, stroke_value))]
+
+    def age_group_counts(self, stroke_value, width=AGE_BUCKET_WIDTH):
+        return self.results[("age_group_counts", (stroke_value, width))]
+
+    def box_stats(self, column, stroke_value):
+        return self.results[("box_stats", (column, stroke_value))]
+
+
+# Queries of every panel (see ChartSpec.queries) for one stroke value
+def panel_requests(stroke_value):
+    return [query for spec in CHARTS.values() for query in spec.queries(stroke_value)]
+
+
+# Issue the queries of every panel concurrently: a refresh takes as long as
+# the slowest query instead of their sum
+async def fetch_panels(aggregates, requests):
+    results = await asyncio.gather(
+        *[getattr(aggregates, name)(*args) for name, args in requests]
+    )
+
+    return PanelResults(dict(zip(requests, results)))
+
+
+# Event loop of the process, on its own thread, so that Dash's blocking
+# callbacks can wait on the gathered queries
+class AsyncQueries:
+    def __init__(self, backend):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="async-queries", daemon=True
+        )
+        self._thread.start()
+        self.aggregates = AsyncSqlAggregates(backend)
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def fetch_panels(self, requests):
+        return self.run(fetch_panels(self.aggregates, requests))
+
+
+def get_async_backend():
+    if config.DATA_BACKEND == "postgres" and asyncpg is not None:
+        return AsyncPostgresBackend()
+
+    return ThreadedBackend(db_utils.get_backend())
+
+
+_queries = None
+_queries_lock = threading.Lock()
+
+
+# Created on first use: threads do not survive the fork of the serving workers
+def get_async_queries():
+    global _queries
+
+    with _queries_lock:
+        if _queries is None:
+            _queries = AsyncQueries(get_async_backend())
+
+    return _queries
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Time the panel queries one by one and gathered"
+    )
+    parser.add_argument("--stroke", default="Yes", help="stroke value of the panels")
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+# DASHBOARD_DATA_BACKEND=postgres python -m functions.async_db_utils
+def main():
+    args = parse_args()
+    queries = get_async_queries()
+    requests = panel_requests(args.stroke)
+
+    async def sequential():
+        for name, request_args in requests:
+            await getattr(queries.aggregates, name)(*request_args)
+
+    for label, run in [
+        ("sequential", sequential),
+        ("gathered", lambda: fetch_panels(queries.aggregates, requests)),
+    ]:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            queries.run(run())
+            timings.append(time.perf_counter() - start)
+        print(f"{label}: {min(timings) * 1000:.1f} ms")
+
+    queries.run(queries.aggregates.backend.close())
+
+
+if __name__ == "__main__":
+    main()
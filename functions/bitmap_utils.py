@@ -0,0 +1,163 @@
+# Import the necessary libraries
+import copy
+
+import numpy as np
+
+from functions.aggregate_utils import (
+    AGE_BUCKET_CAP,
+    AGE_BUCKET_WIDTH,
+    HistogramEngine,
+    box_stats,
+    extend_codes,
+)
+
+# Categorical columns that can be cross-filtered
+BITMAP_COLUMNS = [
+    "gender",
+    "residence_type",
+    "work_type",
+    "smoking_status",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "stroke",
+]
+
+# Number of set bits of every byte value (fallback for numpy < 2.0)
+POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], np.uint8)
+
+
+def popcount(bits):
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(bits).sum())
+
+    return int(POPCOUNT_TABLE[bits].sum())
+
+
+# Packed bits of n_rows rows followed by new ones
+def append_bits(bits, n_rows, new):
+    full, partial = divmod(n_rows, 8)
+    head = np.unpackbits(bits[full:], count=partial).astype(bool)
+    return np.concatenate([bits[:full], np.packbits(np.concatenate([head, new]))])
+
+
+# One packed bitmap per (column, value): combined filters are bitwise ANDs
+# and counts are popcounts, 1 bit per row instead of a full boolean mask
+class BitmapIndex:
+    def __init__(self, dataset):
+        self.n_rows = len(dataset)
+        self.categories = {}
+        self.bitmaps = {}
+
+        for column in BITMAP_COLUMNS:
+            codes = dataset.codes[column]
+            self.categories[column] = list(dataset.categories[column])
+            self.bitmaps[column] = [
+                np.packbits(codes == code)
+                for code in range(len(self.categories[column]))
+            ]
+
+        # Every row selected (the padding bits of the last byte stay 0)
+        self.all_rows = np.packbits(np.ones(self.n_rows, dtype=bool))
+
+    def append(self, batch):
+        # New index with a batch of rows after these: the bitmaps are copied and
+        # only their last, partly filled byte is packed again
+        index = copy.copy(self)
+        index.n_rows = self.n_rows + len(batch)
+        index.categories = {}
+        index.bitmaps = {}
+
+        for column in BITMAP_COLUMNS:
+            categories = list(self.categories[column])
+            codes = extend_codes(categories, batch, column)
+            empty = np.zeros_like(self.all_rows)
+            bitmaps = self.bitmaps[column]
+            index.categories[column] = categories
+            index.bitmaps[column] = [
+                append_bits(
+                    bitmaps[code] if code < len(bitmaps) else empty,
+                    self.n_rows,
+                    codes == code,
+                )
+                for code in range(len(categories))
+            ]
+
+        index.all_rows = append_bits(
+            self.all_rows, self.n_rows, np.ones(len(batch), dtype=bool)
+        )
+        return index
+
+    def bitmap(self, column, value):
+        if value not in self.categories[column]:
+            return np.zeros_like(self.all_rows)
+
+        return self.bitmaps[column][self.categories[column].index(value)]
+
+    def select(self, filters):
+        # OR the values of a column, AND across columns
+        bits = self.all_rows
+        for column, values in filters.items():
+            column_bits = np.zeros_like(self.all_rows)
+            for value in values:
+                column_bits = column_bits | self.bitmap(column, value)
+            bits = bits & column_bits
+
+        return bits
+
+    def value_counts(self, column, bits):
+        counts = np.array(
+            [popcount(bits & bitmap) for bitmap in self.bitmaps[column]],
+            dtype=np.int64,
+        )
+
+        # Sort by descending count (like pandas value_counts) and drop empty ones
+        order = np.argsort(-counts, kind="stable")
+        order = order[counts[order] > 0]
+
+        return [self.categories[column][i] for i in order], counts[order]
+
+    def mask(self, bits):
+        return np.unpackbits(bits, count=self.n_rows).astype(bool)
+
+
+# Dataset restricted by cross-filters, with the same interface as the cube
+class FilteredView:
+    def __init__(self, index, dataset, filters):
+        self.index = index
+        self.dataset = dataset
+        self.bits = index.select(filters)
+
+    def _stroke_bits(self, stroke_value):
+        return self.bits & self.index.bitmap("stroke", stroke_value)
+
+    def value_counts(self, column, stroke_value):
+        return self.index.value_counts(column, self._stroke_bits(stroke_value))
+
+    def values(self, column, stroke_value):
+        mask = self.index.mask(self._stroke_bits(stroke_value))
+        return self.dataset.numeric[column][mask]
+
+    def age_group_counts(self, stroke_value, width=AGE_BUCKET_WIDTH):
+        ages = self.values("age", stroke_value)
+        engine = HistogramEngine.from_values(
+            ages, np.zeros(len(ages), dtype=np.intp), 1, cap=AGE_BUCKET_CAP
+        )
+        labels, counts = engine.histogram(width)
+        observed = np.flatnonzero(counts[0])
+
+        return [labels[i] for i in observed], counts[0][observed]
+
+    def box_stats(self, column, stroke_value):
+        return box_stats(self.values(column, stroke_value))
+
+    def mean(self, column, stroke_value):
+        values = self.values(column, stroke_value)
+        return float(values.mean()) if len(values) else None
+
+    def stroke_counts(self):
+        return (
+            popcount(self.bits),
+            popcount(self._stroke_bits("Yes")),
+            popcount(self._stroke_bits("No")),
+        )
@@ -0,0 +1,55 @@
+# Import the necessary libraries
+import threading
+import time
+from collections import OrderedDict
+
+
+# Bounded LRU/TTL cache of built figures (and KPI values). A hit returns the
+# object the miss built, so callers must copy a figure before changing it.
+class FigureCache:
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl  # seconds, None to keep entries until evicted
+        self._entries = OrderedDict()  # key -> (expiry time, figure)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires, figure = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            return figure
+
+    def set(self, key, figure):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+
+        with self._lock:
+            self._entries[key] = (expires, figure)
+            self._entries.move_to_end(key)
+
+            # Evict the least recently used figures
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, key, build):
+        figure = self.get(key)
+        if figure is None:
+            figure = build()
+            self.set(key, figure)
+
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,113 @@
+# Import the necessary libraries
+import threading
+
+import numpy as np
+
+# Labels of every categorical column in code order. The codes are fixed:
+# labels not listed here are appended when first seen, never reordered, so
+# every dataset, ingested batch and panel uses the same codes.
+CATEGORY_LABELS = {
+    "gender": ["Female", "Male", "Other"],
+    "hypertension": ["No", "Yes"],
+    "heart_disease": ["No", "Yes"],
+    "ever_married": ["No", "Yes"],
+    "work_type": ["Govt_job", "Never_worked", "Private", "Self-employed", "children"],
+    "residence_type": ["Rural", "Urban"],
+    "smoking_status": ["Unknown", "formerly smoked", "never smoked", "smokes"],
+    "stroke": ["No", "Yes"],
+}
+
+# Chart color of each label (the same in every panel and for every filter)
+CATEGORY_COLORS = {
+    "gender": {"Female": "#636efa", "Male": "#ef553b", "Other": "#00cc96"},
+    "residence_type": {"Rural": "#636efa", "Urban": "#ef553b"},
+    "smoking_status": {
+        "never smoked": "#5863f9",
+        "Unknown": "#ec4b34",
+        "formerly smoked": "#9b59b6",
+        "smokes": "#00c58b",
+    },
+    "work_type": {
+        "Private": "#5863f9",
+        "Self-employed": "#ec4b34",
+        "children": "#9b59b6",
+        "Govt_job": "#00c58b",
+        "Never_worked": "#ff9750",
+    },
+}
+
+# Colors of labels without a fixed one, by code
+DEFAULT_COLORS = [
+    "#636efa",
+    "#ef553b",
+    "#00cc96",
+    "#ab63fa",
+    "#ffa15a",
+    "#19d3f3",
+    "#ff6692",
+    "#b6e880",
+    "#ff97ff",
+    "#fecb52",
+]
+
+# Codes are stored as int8
+MAX_CATEGORIES = np.iinfo(np.int8).max + 1
+
+
+class CategoryRegistry:
+    def __init__(self, labels, colors, default_colors=DEFAULT_COLORS):
+        self.default_colors = default_colors
+        self._labels = {column: list(values) for column, values in labels.items()}
+        self._codes = {
+            column: {label: code for code, label in enumerate(values)}
+            for column, values in self._labels.items()
+        }
+        self._colors = colors
+        self._palettes = {}
+        self._lock = threading.Lock()
+
+        for column in self._labels:
+            self._update_palette(column)
+
+    def _update_palette(self, column):
+        fixed = self._colors.get(column, {})
+        self._palettes[column] = np.array(
+            [
+                fixed.get(label, self.default_colors[code % len(self.default_colors)])
+                for code, label in enumerate(self._labels[column])
+            ],
+            dtype=object,
+        )
+
+    # Labels of a column in code order, registering the observed new ones
+    def categories(self, column, observed=()):
+        with self._lock:
+            labels = self._labels.setdefault(column, [])
+            codes = self._codes.setdefault(column, {})
+
+            new_labels = sorted(set(observed) - codes.keys())
+            if new_labels:
+                if len(labels) + len(new_labels) > MAX_CATEGORIES:
+                    raise ValueError(f"Too many categories in column: {column}")
+
+                for label in new_labels:
+                    codes[label] = len(labels)
+                    labels.append(label)
+                self._update_palette(column)
+
+            return list(labels)
+
+    def codes(self, column, labels):
+        # Labels straight from a database may not be registered yet
+        if not self._codes.get(column, {}).keys() >= set(labels):
+            self.categories(column, labels)
+
+        lookup = self._codes[column]
+        return np.array([lookup[label] for label in labels], dtype=np.intp)
+
+    # Color of each label, indexed from the column's palette by code
+    def colors(self, column, labels):
+        return self._palettes[column][self.codes(column, labels)].tolist()
+
+
+registry = CategoryRegistry(CATEGORY_LABELS, CATEGORY_COLORS)
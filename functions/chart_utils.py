@@ -1,418 +1,596 @@
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-import numpy as np
+# Callbacks
+import hashlib
+import time
+
+from dash import Input, Output, Patch, State, ctx, no_update, set_props
+from functions import async_db_utils, config, data_utils, db_utils
+from functions.aggregate_utils import AggregateCube
+from functions.bitmap_utils import BITMAP_COLUMNS, BitmapIndex, FilteredView
+from functions.cache_utils import FigureCache
+from functions.figure_utils import FIGURE_BUILDERS, build_chart
+from functions.job_utils import DiskJobQueue, JobQueue
+from functions.kpi_utils import compute_kpis
+from functions.metrics_utils import InstrumentedSource, stage
+from functions.reload_utils import DataSnapshot, DatasetManager, get_watcher
+from functions.sample_utils import StratifiedSample
+from functions.spec_utils import CHARTS
+from functions.sql_utils import SqlAggregates
+
+# Where the aggregates are computed (see config.QUERY_MODE)
+QUERY_MODES = ("memory", "pushdown")
+
+
+# Settings that would only fail once a callback runs, checked at import
+def check_settings():
+    if config.QUERY_MODE not in QUERY_MODES:
+        raise ValueError(f"Unknown query mode: {config.QUERY_MODE}")
+    backend = db_utils.BACKENDS.get(config.DATA_BACKEND)
+    if backend is None:
+        raise ValueError(f"Unknown data backend: {config.DATA_BACKEND}")
+    if config.QUERY_MODE == "pushdown" and not issubclass(backend, db_utils.SqlBackend):
+        raise ValueError(
+            f"Query pushdown needs a database backend, not {config.DATA_BACKEND}"
+        )
+    if config.FIGURE_BUILDER not in FIGURE_BUILDERS:
+        raise ValueError(f"Unknown figure builder: {config.FIGURE_BUILDER}")
+
+
+check_settings()
+
+
+# Either load the columnar dataset, precompute its group-by counts and bitmap
+# indexes, or (query pushdown) keep no rows at all and ask the database
+def load_sources(reload=False):
+    with stage("load"):
+        if config.QUERY_MODE == "pushdown":
+            aggregates = SqlAggregates(db_utils.get_backend())
+            return None, aggregates, aggregates, None
+
+        # Shared dataset handle (also used by dash_app)
+        if reload:
+            dataset = data_utils.reload_dataset()
+        else:
+            dataset = data_utils.get_dataset()
+        return (
+            dataset,
+            AggregateCube.from_dataset(dataset),
+            dataset,
+            BitmapIndex(dataset),
+        )
+
 
+# Stratified sample the approximate panels are first drawn from (None when no
+# panel is approximate)
+def load_sample(dataset):
+    if not config.APPROXIMATE_PANELS:
+        return None
 
-### Plot generation
-def generate_gender_pie_chart(data, headers, stroke_value):
-    # Convert the data and headers to a pandas DataFrame
-    df = pd.DataFrame(data, columns=headers)
+    with stage("load"):
+        if dataset is not None:
+            return StratifiedSample.from_dataset(
+                dataset, config.SAMPLE_ROWS_PER_CLASS, config.SAMPLE_SEED
+            )
+        return StratifiedSample.from_backend(
+            db_utils.get_backend(), config.SAMPLE_ROWS_PER_CLASS
+        )
 
-    # Get stroke-positive people
-    df = df[df["stroke"] == stroke_value]
 
-    # Count the occurrences of each gender
-    gender_counts = df["gender"].value_counts()
+# Batches ingested into a csv-backed dashboard. The file does not hold them,
+# so every reload of it applies them again (with a database backend they are
+# inserted in its table instead).
+ingested_batches = []
+
+
+# Same snapshot with a batch of new rows (a StrokeDataset): new counts, age
+# histograms and sketches in O(batch), and the rows and bitmap indexes of the
+# cross-filters extended with it. The previous snapshot's sources are left
+# untouched.
+def with_batch(snapshot, batch, version):
+    changes = {"version": version}
+    if config.QUERY_MODE != "pushdown":
+        changes["aggregates"] = snapshot.aggregates.append(batch)
+        changes["dataset"] = changes["stats_source"] = snapshot.dataset.append(batch)
+        changes["bitmap_index"] = snapshot.bitmap_index.append(batch)
+
+    # New rows are not sampled, they only scale the sample's estimates
+    if snapshot.sample is not None:
+        labels = batch.categories["stroke"]
+        changes["sample"] = snapshot.sample.with_population(
+            labels[code] for code in batch.codes["stroke"]
+        )
 
-    figure = go.Figure(
-        data=[go.Pie(labels=gender_counts.index, values=gender_counts.values, hole=0.6)]
-    )
-    figure.update_layout(
-        title={
-            "text": "Gender",
-            "font": {"size": 24},
-            "x": 0.45,  # center title
-        },
-        autosize=False,
-        width=450,
-        height=400,
+    return snapshot.replace(**changes)
+
+
+# Sources of one version of the data
+def load_snapshot(reload, version):
+    dataset, aggregates, stats_source, bitmap_index = load_sources(reload)
+    snapshot = DataSnapshot(
+        dataset, aggregates, stats_source, bitmap_index, load_sample(dataset), version
     )
+    for batch in ingested_batches:
+        snapshot = with_batch(snapshot, batch, version)
 
-    return figure
+    return snapshot
 
 
-def generate_residence_pie_chart(data, headers, residence_stroke_val):
-    # Convert the data and headers to a pandas DataFrame
-    df = pd.DataFrame(data, columns=headers)
+# Current version of the data, reloaded in the background when the source
+# changes (see warm_figures). Callbacks read it through current(): a request
+# keeps the snapshot it started with (reload_utils.install).
+datasets = DatasetManager(
+    load_snapshot, get_watcher() if config.RELOAD_INTERVAL_SECONDS > 0 else None
+)
+current = datasets.current
 
-    # Get stroke-positive people
-    df = df[df["stroke"] == residence_stroke_val]
+# Charts that can be clicked to cross-filter the dashboard, and their column
+CROSS_FILTER_CHARTS = {
+    graph_id: spec.column for graph_id, spec in CHARTS.items() if spec.cross_filter
+}
 
-    # Count the occurrences of each gender
-    gender_counts = df["residence_type"].value_counts()
+# Charts with a stroke dropdown, in page order
+DROPDOWN_CHARTS = [graph_id for graph_id, spec in CHARTS.items() if spec.dropdown]
 
-    figure = go.Figure(
-        data=[go.Pie(labels=gender_counts.index, values=gender_counts.values, hole=0.6)]
-    )
-    figure.update_layout(
-        title={
-            "text": "Residence",
-            "font": {"size": 24},
-            "x": 0.45,  # center title
-        },
-        autosize=False,
-        width=450,
-        height=400,
-    )
+# Serialized figures keyed on (chart id, filter values, dataset version)
+figure_cache = FigureCache(max_entries=256, ttl=3600)
 
-    return figure
-
-
-def generate_agebar_chart(data, headers, age_stroke_val):
-    # Convert the data and headers to a pandas DataFrame
-    df = pd.DataFrame(data, columns=headers)
-
-    # Get stroke-positive people
-    df = df[df["stroke"] == age_stroke_val]
-
-    # Convert age column to numeric data type
-    df["age"] = pd.to_numeric(df["age"], errors="coerce")
-
-    # Define age groups
-    age_groups = [
-        "0-5",
-        "5-10",
-        "10-15",
-        "15-20",
-        "20-25",
-        "25-30",
-        "30-35",
-        "35-40",
-        "40-45",
-        "45-50",
-        "50-55",
-        "55-60",
-        "60-65",
-        "65-70",
-        "70-75",
-        "75-80",
-        "80-85",
-        "85-90",
-        "90+",
-    ]
-
-    # Assign each age to an age group
-    df["Age Group"] = pd.cut(
-        df["age"],
-        bins=[
-            0,
-            5,
-            10,
-            15,
-            20,
-            25,
-            30,
-            35,
-            40,
-            45,
-            50,
-            55,
-            60,
-            65,
-            70,
-            75,
-            80,
-            85,
-            90,
-            float("inf"),
-        ],
-        labels=age_groups,
-        right=False,
-    )
+# Expensive panels run off the request thread (in background callback
+# processes when enabled); identical in-flight requests are computed once
+if config.BACKGROUND_CALLBACKS:
+    panel_jobs = DiskJobQueue(config.BACKGROUND_DIR)
+else:
+    panel_jobs = JobQueue(config.JOB_WORKERS)
 
-    # Group the data by age group and calculate the count
-    grouped_data = df.groupby("Age Group").size().reset_index(name="Count")
 
-    # Create the bar chart
-    fig = go.Figure(
-        data=go.Bar(
-            x=grouped_data["Age Group"],
-            y=grouped_data["Count"],
-            text=grouped_data["Count"],
-            textposition="auto",
-        )
-    )
+# Reload the data now (the watcher does it when the source changes)
+def reload_data():
+    return datasets.reload()
 
-    # Customize the layout
-    fig.update_layout(
-        title={
-            "text": "Age",
-            "font": {"size": 24},
-            "x": 0.5,  # center title
-        },
-        xaxis_title="Age Group",
-        yaxis_title="Count",
-        width=800,
-        height=400,
-    )
 
-    return fig
+# Append new patient rows without a reload. The new snapshot is built first,
+# then the rows are kept (inserted in the database, or held for the next
+# reload of the csv file): a failed insert changes nothing.
+def ingest_rows(rows):
+    rows = db_utils.normalize_rows(rows)
+    if not rows:  # nothing new, the current version stays
+        return 0
 
+    builder = data_utils.DatasetBuilder(db_utils.STROKE_COLUMNS)
+    builder.add_rows(rows)
+    batch = builder.build()
 
-def generate_stroke_positive_smoker_chart(data, headers, smoker_stroke_val):
-    # Convert the data and headers to a pandas DataFrame
-    df = pd.DataFrame(data, columns=headers)
+    def add_batch(snapshot, version):
+        snapshot = with_batch(snapshot, batch, version)
+        if config.DATA_BACKEND == "csv":
+            ingested_batches.append(batch)
+        else:
+            db_utils.get_backend().insert_rows(rows)
+        return snapshot
 
-    # Get stroke-positive people
-    df = df[df["stroke"] == smoker_stroke_val]
+    datasets.update(add_batch)
+    return len(rows)
 
-    # Count the occurrences of each smoking case
-    smoking_counts = df["smoking_status"].value_counts()
 
-    color_map = {
-        "never smoked": "#5863f9",
-        "Unknown": "#ec4b34",
-        "formerly smoked": "#9b59b6",
-        "smokes": "#00c58b",
-    }
-    colors = [color_map[label] for label in smoking_counts.index]
-
-    figure = go.Figure(
-        go.Treemap(
-            labels=smoking_counts.index,
-            parents=[""] * len(smoking_counts),  # single-level treemap
-            values=smoking_counts.values,
-            marker=dict(colors=colors),
-            textinfo="label+value+percent root",
-        )
-    )
+# Toggle the clicked label in the cross-filters (any other trigger clears them)
+def toggle_cross_filter(chart_id, click_data, filters):
+    if chart_id not in CROSS_FILTER_CHARTS or not click_data:
+        return {}
 
-    figure.update_layout(
-        title={
-            "text": "Smoking status",
-            "font": {"size": 24},
-            "x": 0.45,  # center title
-        },
-        autosize=False,
-        width=500,
-        height=450,
-    )
+    column = CROSS_FILTER_CHARTS[chart_id]
+    filters = dict(filters or {})
+    values = set(filters.get(column, [])) ^ {click_data["points"][0]["label"]}
+    filters[column] = sorted(values)
 
-    return figure
+    return {column: values for column, values in filters.items() if values}
 
 
-def generate_job_tree_chart(data, headers, job_stroke_val):
-    # Convert the data and headers to a pandas DataFrame
-    df = pd.DataFrame(data, columns=headers)
+# Cross-filters received from outside the page (column -> list of labels)
+def check_filters(filters):
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be a JSON object")
 
-    # Get stroke-positive people
-    df = df[df["stroke"] == job_stroke_val]
+    for column, values in filters.items():
+        if column not in BITMAP_COLUMNS:
+            raise ValueError(f"Cannot filter on column: {column}")
+        if not isinstance(values, list) or not all(
+            isinstance(value, str) for value in values
+        ):
+            raise ValueError(f"Filter values of {column} must be a list of strings")
 
-    # Count the occurrences of each smoking case
-    job_counts = df["work_type"].value_counts()
 
-    color_map = {
-        "Private": "#5863f9",
-        "Self-employed": "#ec4b34",
-        "children": "#9b59b6",
-        "Govt_job": "#00c58b",
-        "Never_worked": "#ff9750",
+# Cross-filters that apply to a panel (a panel never filters on its own column)
+def active_filters(filters, column=None):
+    return {
+        name: sorted(values)
+        for name, values in (filters or {}).items()
+        if values and name != column
     }
-    colors = [color_map[label] for label in job_counts.index]
-
-    figure = go.Figure(
-        data=[
-            go.Pie(
-                labels=job_counts.index,
-                values=job_counts.values,
-                marker=dict(colors=colors),
-                hole=0.6,
-            )
-        ]
-    )
 
-    figure.update_layout(
-        title={
-            "text": "Occupation",
-            "font": {"size": 24},
-            "x": 0.45,  # center title
-        },
-        autosize=False,
-        width=500,
-        height=450,
-    )
 
-    return figure
+def filter_key(filters):
+    return tuple((column, tuple(values)) for column, values in sorted(filters.items()))
 
 
-def generate_glucose_box_chart(data, headers):
-    # Convert the data and headers to a pandas DataFrame
-    df = pd.DataFrame(data, columns=headers)
+# Cross-filtered panels are answered from the bitmap indexes in memory mode,
+# from queries on the filtered rows under pushdown, unfiltered ones from the
+# aggregates. The stratified sample has its own indexes. Queries are timed as
+# the "aggregation" stage.
+def filtered(filters, source):
+    if filters:
+        with stage("filter"):
+            if hasattr(source, "filter"):
+                source = source.filter(filters)
+            else:
+                snapshot = current()
+                source = FilteredView(snapshot.bitmap_index, snapshot.dataset, filters)
 
-    figure = go.Figure()
-    figure.add_trace(
-        go.Box(
-            y=df[df["stroke"] == "No"]["avg_glucose_level"],
-            name="Healthy",
-            marker_color="lightseagreen",
-        )
-    )
-    figure.add_trace(
-        go.Box(
-            y=df[df["stroke"] == "Yes"]["avg_glucose_level"],
-            name="Stroke",
-            marker_color="indianred",
-        )
-    )
-    figure.update_layout(
-        title={
-            "text": "Avg. glucose levels",
-            "font": {"size": 24},
-            "x": 0.5,  # center title
-        },
-        xaxis_title="Patient",
-        yaxis_title="Glucose levels (mg/dL)",
-        autosize=False,
-        width=450,
-        height=400,
-    )
+    return InstrumentedSource(source)
 
-    return figure
 
+def build_figure(build):
+    with stage("figure"):
+        return build()
 
-def generate_bmi_box_chart(data, headers):
-    # Convert the data and headers to a pandas DataFrame
-    df = pd.DataFrame(data, columns=headers)
 
-    figure = go.Figure()
-    figure.add_trace(
-        go.Box(
-            y=df[df["stroke"] == "No"]["bmi"],
-            name="Healthy",
-            marker_color="lightseagreen",
-        )
-    )
-    figure.add_trace(
-        go.Box(
-            y=df[df["stroke"] == "Yes"]["bmi"],
-            name="Stroke",
-            marker_color="indianred",
-        )
+def cached_figure(chart_id, filters, build, source=None):
+    # Figures estimated from the sample never stand in for the exact ones
+    approximate = getattr(source, "approximate", False)
+    key = (chart_id, filters, current().version, approximate)
+    return figure_cache.get_or_create(key, lambda: build_figure(build))
+
+
+# The job computes the panel on the caller's snapshot
+def run_panel_job(graph_id, value=None, filters=None):
+    snapshot = current()
+    key = (graph_id, value, filter_key(active_filters(filters)), snapshot.version)
+    return panel_jobs.run(
+        key, datasets.run_pinned, snapshot, update_panel, graph_id, value, None, filters
     )
-    figure.update_layout(
-        title={
-            "text": "BMI",
-            "font": {"size": 24},
-            "x": 0.5,  # center title
-        },
-        xaxis_title="Patient",
-        yaxis_title="Body mass index",
-        autosize=False,
-        width=450,
-        height=400,
+
+
+# Figure of any panel: cross-filtering, aggregation (from the given source or
+# the panel's default one), caching and figure construction
+def update_panel(graph_id, value=None, source=None, filters=None):
+    spec = CHARTS[graph_id]
+    filters = active_filters(filters, spec.filter_column)
+    if source is None:
+        snapshot = current()
+        source = snapshot.aggregates
+        if spec.aggregation == "box_stats":
+            source = snapshot.stats_source
+
+    return cached_figure(
+        graph_id,
+        (value, filter_key(filters)),
+        lambda: build_chart(spec, filtered(filters, source), value),
+        source,
     )
 
-    return figure
 
+# Figure of a panel, e.g. for /api/figures (None if the chart id is unknown).
+# Heavy panels are computed on the job queue.
+def panel_figure(graph_id, value=None, filters=None):
+    if graph_id not in CHARTS:
+        return None
+
+    if CHARTS[graph_id].heavy:
+        return run_panel_job(graph_id, value, filters)
+    return update_panel(graph_id, value, filters=filters)
 
-# Callbacks
-from dash import Input, Output
-from functions import data_utils
 
-# Fetch the data and headers
-data, headers = data_utils.fetch_selected_data()
+# Validator of a panel's figure, known without building it: the figure only
+# depends on the chart, its stroke value, the filters and the data version
+def panel_etag(graph_id, value=None, filters=None):
+    key = (graph_id, value, filter_key(active_filters(filters)), current().version)
+    return hashlib.sha1(repr(key).encode()).hexdigest()
 
 
 # Define callback functions
-def update_kpis_chart(chart_id):
-    df = pd.DataFrame(data, columns=headers)
+# Values of the KPI cards (config.KPIS), recomputed once per dataset version
+# and set of filters
+def update_kpis_chart(chart_id, filters=None):
+    filters = active_filters(filters)
+    snapshot = current()
+    key = ("kpis", tuple(config.KPIS), filter_key(filters), snapshot.version)
+
+    return figure_cache.get_or_create(
+        key, lambda: compute_kpis(filtered(filters, snapshot.aggregates), config.KPIS)
+    )
+
 
+# Every panel of the dashboard at once (one stroke value per chart of
+# DROPDOWN_CHARTS): the count-based charts come from a single pass over the
+# data (one GROUP BY query under pushdown), or with async queries every
+# panel's queries are gathered, box plots included
+def compute_snapshot(*stroke_values):
+    values = dict(zip(DROPDOWN_CHARTS, stroke_values))
+    prefetched = config.ASYNC_QUERIES and config.QUERY_MODE == "pushdown"
+    with stage("aggregation"):
+        if prefetched:
+            counts = async_db_utils.get_async_queries().fetch_panels(
+                [
+                    query
+                    for graph_id, spec in CHARTS.items()
+                    for query in spec.queries(values.get(graph_id))
+                ]
+            )
+        else:
+            counts = current().aggregates.snapshot()
+
+    def exact(graph_id):
+        # The snapshot's counts have no box statistics
+        if CHARTS[graph_id].aggregation == "box_stats" and not prefetched:
+            return run_panel_job(graph_id)
+        return update_panel(graph_id, values.get(graph_id), counts)
+
+    # Approximate panels start from the sample (see snapshot_panel)
     return (
-        len(df),
-        (df["stroke"] == "Yes").sum(),
-        (df["stroke"] == "No").sum(),
+        *update_kpis_chart(None),
+        *[
+            snapshot_panel(
+                graph_id,
+                values.get(graph_id),
+                lambda graph_id=graph_id: exact(graph_id),
+            )
+            for graph_id in CHARTS
+        ],
+    )
+
+
+# Once a graph is on the page only its traces change: updates send a Patch of
+# the figure data and the layout (titles, fonts, sizes) stays in the browser.
+# The annotations are also sent for approximate panels (the sample's note).
+def figure_update(figure, loaded=True, annotations=False):
+    if not loaded:
+        return figure
+    if hasattr(figure, "to_plotly_json"):
+        figure = figure.to_plotly_json()
+
+    patch = Patch()
+    patch["data"] = figure["data"]
+    if annotations:
+        patch["layout"]["annotations"] = figure["layout"].get("annotations", [])
+    return patch
+
+
+# Note of the figures estimated from the sample, until the exact one replaces it
+APPROXIMATE_NOTE = {
+    "text": "Estimated from a sample, computing the exact values...",
+    "xref": "paper",
+    "yref": "paper",
+    "x": 1,
+    "y": 1.08,
+    "xanchor": "right",
+    "showarrow": False,
+    "font": {"size": 11, "color": "gray"},
+}
+
+
+# Panels drawn from the stratified sample first (config.APPROXIMATE_PANELS)
+def approximate(graph_id):
+    return current().sample is not None and graph_id in config.APPROXIMATE_PANELS
+
+
+def approximate_figure(graph_id, value=None, filters=None):
+    figure = update_panel(graph_id, value, current().sample, filters)
+    if hasattr(figure, "to_plotly_json"):
+        figure = figure.to_plotly_json()
+
+    # The cached figure is shared: the note goes on a copy of it
+    layout = figure["layout"]
+    annotations = list(layout.get("annotations", [])) + [APPROXIMATE_NOTE]
+    return {"data": figure["data"], "layout": dict(layout, annotations=annotations)}
+
+
+# Ask the page for the exact figure of an approximate panel: it is computed by
+# the panel's exact callback (register_exact_panel), after this response
+def request_exact(graph_id, value, filters):
+    set_props(
+        f"{graph_id}-exact",
+        {"data": {"value": value, "filters": filters, "requested": time.time()}},
     )
 
 
-def update_gender_pie_chart(stroke_value):
-    figure = generate_gender_pie_chart(data, headers, stroke_value)
-    return figure
+def snapshot_panel(graph_id, value, exact):
+    if approximate(graph_id):
+        return approximate_figure(graph_id, value)
 
+    return exact()
 
-def update_residence_pie_chart(residence_stroke_val):
-    figure = generate_residence_pie_chart(data, headers, residence_stroke_val)
-    return figure
 
+# Response of a panel callback: approximate panels answer from the sample right
+# away and the exact figure replaces it once computed
+def panel_response(graph_id, value, filters, exact, loaded=True):
+    if not approximate(graph_id):
+        return figure_update(exact(), loaded)
 
-def update_agebar_chart(age_stroke_val):
-    figure = generate_agebar_chart(data, headers, age_stroke_val)
-    return figure
+    request_exact(graph_id, value, filters)
+    return figure_update(approximate_figure(graph_id, value, filters), loaded, True)
 
 
-def update_stroke_positive_smoker_chart(smoker_stroke_val):
-    figure = generate_stroke_positive_smoker_chart(data, headers, smoker_stroke_val)
-    return figure
+# Called by a reload with the new snapshot pinned, before it is swapped in:
+# the unfiltered figures and KPIs of the new version are built, so the first
+# page loads after the swap are served from the cache. The figures of the
+# previous versions stay for the requests still on them (the cache evicts
+# them by age and size).
+def warm_figures():
+    for graph_id, spec in CHARTS.items():
+        for value in ["No", "Yes"] if spec.dropdown else [None]:
+            update_panel(graph_id, value)
+            if approximate(graph_id):
+                approximate_figure(graph_id, value)
 
+    update_kpis_chart(None)
 
-def update_job_tree_chart(job_stroke_val):
-    figure = generate_job_tree_chart(data, headers, job_stroke_val)
-    return figure
 
+datasets.warm = warm_figures
 
-def update_glucose_box_chart(chart_id):
-    figure = generate_glucose_box_chart(data, headers)
-    return figure
 
+# In the lazy layout a graph is only drawn once it has been visible
+def loaded_state(graph_id):
+    if config.LAZY_LAYOUT:
+        return [State(f"{graph_id}-visible", "data")]
 
-def update_bmi_box_chart(chart_id):
-    figure = generate_bmi_box_chart(data, headers)
-    return figure
+    return []
 
 
-# Register the callback functions
+# Compute a panel of the lazy layout once it becomes visible
+def register_lazy_panel(app, graph_id, heavy):
+    spec = CHARTS[graph_id]
+    states = [State(spec.dropdown, "value")] if spec.dropdown else []
+
+    def update_lazy_panel_callback(visible, *args):
+        *value, filters = args
+        value = value[0] if value else None
+        return panel_response(
+            graph_id,
+            value,
+            filters,
+            lambda: panel_figure(graph_id, value, filters),
+            loaded=False,
+        )
+
+    update_lazy_panel_callback.__name__ = f"update_{spec.name}_lazy_callback"
+
+    app.callback(
+        Output(graph_id, "figure", allow_duplicate=True),
+        Input(f"{graph_id}-visible", "data"),
+        *states,
+        State("cross-filter", "data"),
+        prevent_initial_call=True,
+        **(heavy if spec.heavy else {}),
+    )(update_lazy_panel_callback)
+
+
+# Replace the figure of an approximate panel by the exact one
+def register_exact_panel(app, graph_id, heavy):
+    spec = CHARTS[graph_id]
+
+    def update_exact_panel_callback(request):
+        figure = panel_figure(graph_id, request["value"], request["filters"])
+        return figure_update(figure, annotations=True)
+
+    update_exact_panel_callback.__name__ = f"update_{spec.name}_exact_callback"
+
+    app.callback(
+        Output(graph_id, "figure", allow_duplicate=True),
+        Input(f"{graph_id}-exact", "data"),
+        prevent_initial_call=True,
+        **(heavy if spec.heavy else {}),
+    )(update_exact_panel_callback)
+
+
+# Incremental updates: each dropdown (and the cross-filters) only recomputes
+# its own panel
+def register_panel(app, graph_id, heavy):
+    spec = CHARTS[graph_id]
+    inputs = [Input(spec.dropdown, "value")] if spec.dropdown else []
+
+    def update_panel_callback(*args):
+        if not config.LAZY_LAYOUT:
+            args = (*args, True)
+        *value, filters, version, loaded = args
+        value = value[0] if value else None
+        return panel_response(
+            graph_id,
+            value,
+            filters,
+            lambda: panel_figure(graph_id, value, filters),
+            loaded,
+        )
+
+    update_panel_callback.__name__ = f"update_{spec.name}_callback"
+
+    app.callback(
+        Output(graph_id, "figure", allow_duplicate=True),
+        [*inputs, Input("cross-filter", "data"), Input("data-version", "data")],
+        *loaded_state(graph_id),
+        prevent_initial_call=True,
+        **(heavy if spec.heavy else {}),
+    )(update_panel_callback)
+
+
+# Register the callback functions (every panel's from its spec)
 def register_callbacks(app):
+    # Options of the expensive panels' callbacks
+    heavy = {"background": True} if config.BACKGROUND_CALLBACKS else {}
 
-    @app.callback(
-        Output("kpi-total", "children"),
-        Output("kpi-stroke", "children"),
-        Output("kpi-no-stroke", "children"),
-        Input("gender-pie-chart", "figure"),  # or a dropdown, etc.
-    )
-    def update_kpis_callback(chart_id):
-        return update_kpis_chart(chart_id)
+    if config.LAZY_LAYOUT:
+        for graph_id in CHARTS:
+            register_lazy_panel(app, graph_id, heavy)
+    else:
+        register_snapshot(app)
 
-    @app.callback(
-        Output("gender-pie-chart", "figure"), [Input("gender_stroke_val", "value")]
-    )
-    def update_gender_pie_chart_callback(gender_stroke_val):
-        return update_gender_pie_chart(gender_stroke_val)
+    for graph_id in CHARTS:
+        if approximate(graph_id):
+            register_exact_panel(app, graph_id, heavy)
 
+    register_dashboard_callbacks(app)
+    for graph_id in CHARTS:
+        register_panel(app, graph_id, heavy)
+
+
+# Initial page load: one request computes every panel
+def register_snapshot(app):
     @app.callback(
-        Output("residence-pie-chart", "figure"),
-        [Input("residence_stroke_val", "value")],
+        *[Output(kpi_id, "children") for kpi_id in config.KPIS],
+        *[Output(graph_id, "figure") for graph_id in CHARTS],
+        Input("dashboard", "id"),
+        *[State(CHARTS[graph_id].dropdown, "value") for graph_id in DROPDOWN_CHARTS],
     )
-    def update_residence_pie_chart_callback(residence_stroke_val):
-        return update_residence_pie_chart(residence_stroke_val)
+    def update_snapshot_callback(dashboard_id, *stroke_values):
+        values = dict(zip(DROPDOWN_CHARTS, stroke_values))
+        for graph_id in CHARTS:
+            if approximate(graph_id):
+                request_exact(graph_id, values.get(graph_id), {})
 
-    @app.callback(Output("agebar-chart", "figure"), [Input("age_stroke_val", "value")])
-    def update_agebar_chart_callback(age_stroke_val):
-        return update_agebar_chart(age_stroke_val)
+        return compute_snapshot(*stroke_values)
 
+
+# Cross-filtering and the KPIs
+def register_dashboard_callbacks(app):
+    # Clicking a slice toggles it as a filter of every other panel
     @app.callback(
-        Output("stroke-positive-smoker-chart", "figure"),
-        [Input("smoker_stroke_val", "value")],
+        Output("cross-filter", "data"),
+        *[Input(graph_id, "clickData") for graph_id in CROSS_FILTER_CHARTS],
+        Input("clear-cross-filter", "n_clicks"),
+        State("cross-filter", "data"),
+        prevent_initial_call=True,
     )
-    def update_stroke_positive_smoker_chart_callback(smoker_stroke_val):
-        return update_stroke_positive_smoker_chart(smoker_stroke_val)
+    def update_cross_filter_callback(*args):
+        filters = args[-1]
+        click_data = ctx.triggered[0]["value"] if ctx.triggered else None
+        return toggle_cross_filter(ctx.triggered_id, click_data, filters)
 
     @app.callback(
-        Output("job-tree-chart", "figure"),
-        [Input("job_stroke_val", "value")],
+        Output("cross-filter-summary", "children"),
+        Input("cross-filter", "data"),
     )
-    def update_job_tree_chart_callback(job_stroke_val):
-        return update_job_tree_chart(job_stroke_val)
+    def update_cross_filter_summary_callback(filters):
+        if not filters:
+            return "Click a chart segment to filter the other panels"
+        return "Filtered by " + "; ".join(
+            f"{column.replace('_', ' ')}: {', '.join(values)}"
+            for column, values in sorted(filters.items())
+        )
 
+    # Dataset version signal: pages poll the version, which only changes when
+    # the data is reloaded or rows are ingested
     @app.callback(
-        Output("glucose-bar-chart", "figure"),
-        [Input("glucose-bar-chart", "id")],
+        Output("data-version", "data"),
+        Input("data-version-interval", "n_intervals"),
+        State("data-version", "data"),
+        prevent_initial_call=True,
     )
-    def update_glucose_box_chart_callback(chart_id):
-        return update_glucose_box_chart(chart_id)
+    def update_data_version_callback(n_intervals, version):
+        latest = current().version
+        return latest if version != latest else no_update
 
+    # KPIs only recompute when the data or the cross-filters change
     @app.callback(
-        Output("bmi-bar-chart", "figure"),
-        [Input("bmi-bar-chart", "id")],
+        *[Output(kpi_id, "children", allow_duplicate=True) for kpi_id in config.KPIS],
+        Input("data-version", "data"),
+        Input("cross-filter", "data"),
+        prevent_initial_call=True,
     )
-    def update_bmi_box_chart_callback(chart_id):
-        return update_bmi_box_chart(chart_id)
+    def update_kpis_callback(version, filters):
+        return update_kpis_chart(None, filters)
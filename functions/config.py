@@ -0,0 +1,112 @@
+# Import the necessary libraries
+import os
+
+# Dashboard settings, overridable through environment variables
+
+# Where the data is read from: "csv", "postgres" or "sqlite"
+DATA_BACKEND = os.environ.get("DASHBOARD_DATA_BACKEND", "csv")
+
+# Where aggregates are computed: "memory" (load the rows once and aggregate in
+# the dashboard process) or "pushdown" (GROUP BY queries run in the database)
+QUERY_MODE = os.environ.get("DASHBOARD_QUERY_MODE", "memory")
+
+# Clean dataset used by the csv backend
+CSV_PATH = os.environ.get(
+    "DASHBOARD_CSV_PATH", "datasets/healthcare_stroke_dataset_clean.csv"
+)
+
+# Memory-mapped .npy copy of the csv columns, empty to disable the cache
+CACHE_DIR = os.environ.get("DASHBOARD_CACHE_DIR", "datasets/.cache")
+
+# SQLite stand-in for the PostgreSQL database
+SQLITE_PATH = os.environ.get("DASHBOARD_SQLITE_PATH", "datasets/stroke_db.sqlite")
+
+# PostgreSQL connection parameters
+POSTGRES = {
+    "dbname": os.environ.get("DASHBOARD_PG_DBNAME", "stroke_db"),
+    "user": os.environ.get("DASHBOARD_PG_USER", "manfernandez"),
+    "password": os.environ.get("DASHBOARD_PG_PASSWORD", ""),
+    "host": os.environ.get("DASHBOARD_PG_HOST", "127.0.0.1"),
+    "port": os.environ.get("DASHBOARD_PG_PORT", "5432"),
+}
+POSTGRES_TABLE = os.environ.get("DASHBOARD_PG_TABLE", "public.stroke_data")
+
+# Connection pool size and number of rows streamed per chunk
+DB_MIN_CONNECTIONS = int(os.environ.get("DASHBOARD_DB_MIN_CONNECTIONS", "1"))
+DB_MAX_CONNECTIONS = int(os.environ.get("DASHBOARD_DB_MAX_CONNECTIONS", "4"))
+DB_CHUNK_SIZE = int(os.environ.get("DASHBOARD_DB_CHUNK_SIZE", "50000"))
+
+# Under pushdown, issue the queries of every panel concurrently on an asyncio
+# event loop (asyncpg for postgres when installed, worker threads otherwise)
+ASYNC_QUERIES = os.environ.get("DASHBOARD_ASYNC_QUERIES", "0") == "1"
+
+# How postgres rows are streamed: "cursor" (server-side cursor) or "copy"
+POSTGRES_FETCH_METHOD = os.environ.get("DASHBOARD_PG_FETCH_METHOD", "cursor")
+
+# Threads computing the expensive panels (age histogram, box plots)
+JOB_WORKERS = int(os.environ.get("DASHBOARD_JOB_WORKERS", "4"))
+
+# Run the expensive panels as Dash background callbacks in separate processes
+# (needs diskcache), with their job state and results kept in BACKGROUND_DIR
+BACKGROUND_CALLBACKS = os.environ.get("DASHBOARD_BACKGROUND_CALLBACKS", "0") == "1"
+BACKGROUND_DIR = os.environ.get(
+    "DASHBOARD_BACKGROUND_DIR", "datasets/.cache/background"
+)
+
+# Record the memory allocated by every callback and stage in the /metrics
+# histograms (tracemalloc slows the dashboard down, off by default)
+TRACE_ALLOCATIONS = os.environ.get("DASHBOARD_TRACE_ALLOCATIONS", "0") == "1"
+
+# Callback requests sent with PROFILE_HEADER run under cProfile (when enabled)
+# and their stats are written to PROFILE_DIR
+PROFILING = os.environ.get("DASHBOARD_PROFILING", "0") == "1"
+PROFILE_HEADER = os.environ.get("DASHBOARD_PROFILE_HEADER", "X-Profile")
+PROFILE_DIR = os.environ.get("DASHBOARD_PROFILE_DIR", "datasets/.cache/profiles")
+
+# Lazy layout: the KPIs are embedded in the page and each panel is computed
+# once it scrolls into view, instead of all of them on page load
+LAZY_LAYOUT = os.environ.get("DASHBOARD_LAZY_LAYOUT", "0") == "1"
+
+# Compress the HTTP responses (brotli when installed and accepted, else gzip)
+# bigger than COMPRESSION_MIN_BYTES
+COMPRESSION = os.environ.get("DASHBOARD_COMPRESSION", "1") == "1"
+COMPRESSION_MIN_BYTES = int(os.environ.get("DASHBOARD_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("DASHBOARD_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("DASHBOARD_BROTLI_QUALITY", "5"))
+
+# Approximate mode: the panels listed here (graph ids) are first drawn from a
+# sample of SAMPLE_ROWS_PER_CLASS rows per stroke class, with 95% error bounds,
+# and replaced by the exact figure once it is computed
+APPROXIMATE_PANELS = [
+    graph_id
+    for graph_id in os.environ.get("DASHBOARD_APPROXIMATE_PANELS", "").split(",")
+    if graph_id
+]
+SAMPLE_ROWS_PER_CLASS = int(os.environ.get("DASHBOARD_SAMPLE_ROWS_PER_CLASS", "20000"))
+SAMPLE_SEED = int(os.environ.get("DASHBOARD_SAMPLE_SEED", "0"))
+
+# KPI cards shown above the charts (ids of functions/kpi_utils.KPIS), and how
+# often pages check for a new dataset version to refresh them (0 to never)
+KPIS = os.environ.get("DASHBOARD_KPIS", "kpi-total,kpi-no-stroke,kpi-stroke").split(",")
+KPI_REFRESH_SECONDS = int(os.environ.get("DASHBOARD_KPI_REFRESH_SECONDS", "10"))
+
+# How the figures are built: "dict" (plain figure dicts over pre-serialized
+# layouts, skipping plotly's validators) or "graph_objects" (go.Figure). With
+# VERIFY_FIGURES every dict figure is checked by go.Figure's validators.
+FIGURE_BUILDER = os.environ.get("DASHBOARD_FIGURE_BUILDER", "dict")
+VERIFY_FIGURES = os.environ.get("DASHBOARD_VERIFY_FIGURES", "0") == "1"
+
+# Hot reload: every RELOAD_INTERVAL_SECONDS (0 to never) the source is checked
+# for changes (the csv file's size and mtime, or a change marker of the table)
+# and the data is rebuilt in the background. CHANGE_MARKER_QUERY replaces the
+# default marker of the database backends (e.g. "SELECT max(updated_at) ...").
+RELOAD_INTERVAL_SECONDS = int(os.environ.get("DASHBOARD_RELOAD_INTERVAL_SECONDS", "10"))
+CHANGE_MARKER_QUERY = os.environ.get("DASHBOARD_CHANGE_MARKER_QUERY", "")
+
+# Token clients of /api/ingest send as "Authorization: Bearer <token>"
+# (ingest is disabled when empty)
+INGEST_TOKEN = os.environ.get("DASHBOARD_INGEST_TOKEN", "")
+
+# Number of processes serving the app (set by serve.py). Rows posted to
+# /api/ingest would only reach one of them, so ingest is refused with several.
+WORKERS = int(os.environ.get("DASHBOARD_WORKERS", "1"))
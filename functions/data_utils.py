@@ -1,44 +1,370 @@
 # Import the necessary libraries
-# import psycopg2
+import hashlib
+import json
+import os
+
+import numpy as np
 import pandas as pd
 
+from functions import config
+from functions.aggregate_utils import box_stats, extend_codes
+from functions.category_utils import registry
 
-# Function to connect to PostgreSQL database and fetch data
-""" def fetch_selected_data():
-    try:
-        # Connect to your PostgreSQL database
-        conn = psycopg2.connect(
-            dbname="stroke_db",
-            user="manfernandez",  # mostly this is used
-            password="",
-            host="127.0.0.1",  # mostly this is used
-            port="5432",  # mostly this is used
+# Columns kept as native numeric arrays, every other column is dictionary-encoded
+NUMERIC_COLUMNS = {
+    "id": np.int64,
+    "age": np.int64,
+    "avg_glucose_level": np.float64,
+    "bmi": np.float64,
+}
+
+
+# Version of the on-disk column cache layout (2: codes from the category
+# registry, whose fixed label order older caches do not follow)
+CACHE_FORMAT = 2
+
+
+# Columnar, typed in-memory store of the stroke dataset
+class StrokeDataset:
+    def __init__(self, headers, numeric, codes, categories, version=1):
+        self.headers = headers
+        self.numeric = numeric  # column -> float/int ndarray
+        self.codes = codes  # column -> int8 ndarray of category codes
+        self.categories = categories  # column -> list of category labels
+        self.version = version
+
+    @classmethod
+    def from_frame(cls, df, version=1):
+        numeric = {}
+        codes = {}
+        categories = {}
+
+        for column in df.columns:
+            if column in NUMERIC_COLUMNS:
+                numeric[column] = df[column].to_numpy(dtype=NUMERIC_COLUMNS[column])
+            else:
+                # Fixed codes of the category registry
+                observed = pd.unique(df[column].dropna())
+                categories[column] = registry.categories(column, observed)
+                codes[column] = pd.Categorical(
+                    df[column], categories=categories[column]
+                ).codes.astype(np.int8)
+
+        return cls(df.columns.tolist(), numeric, codes, categories, version)
+
+    def __len__(self):
+        return len(self.codes["stroke"])
+
+    def mask(self, column, value):
+        # Compare integer codes instead of the boxed string values
+        if value not in self.categories[column]:
+            return np.zeros(len(self), dtype=bool)
+
+        return self.codes[column] == self.categories[column].index(value)
+
+    def values(self, column, stroke_value):
+        # Numeric values of a column for one stroke class
+        return self.numeric[column][self.mask("stroke", stroke_value)]
+
+    def box_stats(self, column, stroke_value):
+        return box_stats(self.values(column, stroke_value))
+
+    def mean(self, column, stroke_value):
+        values = self.values(column, stroke_value)
+        return float(values.mean()) if len(values) else None
+
+    def value_counts(self, column, stroke_value):
+        # Count the occurrences of each category for one stroke class
+        codes = self.codes[column][self.mask("stroke", stroke_value)]
+        counts = np.bincount(codes, minlength=len(self.categories[column]))
+
+        # Sort by descending count (like pandas value_counts) and drop empty ones
+        order = np.argsort(-counts, kind="stable")
+        order = order[counts[order] > 0]
+
+        return [self.categories[column][i] for i in order], counts[order]
+
+    def stroke_counts(self):
+        counts = np.bincount(
+            self.codes["stroke"], minlength=len(self.categories["stroke"])
         )
+        by_label = dict(zip(self.categories["stroke"], counts.tolist()))
+
+        return len(self), by_label.get("Yes", 0), by_label.get("No", 0)
+
+    def take(self, rows):
+        # New dataset with only the given rows (e.g. a sample)
+        return StrokeDataset(
+            self.headers,
+            {column: values[rows] for column, values in self.numeric.items()},
+            {column: codes[rows] for column, codes in self.codes.items()},
+            {column: list(labels) for column, labels in self.categories.items()},
+            self.version,
+        )
+
+    def append(self, batch):
+        # New dataset with a batch of rows (e.g. ingested ones) after these
+        categories = {
+            column: list(labels) for column, labels in self.categories.items()
+        }
+        codes = {
+            column: np.concatenate(
+                [values, extend_codes(categories[column], batch, column)]
+            ).astype(np.int8)
+            for column, values in self.codes.items()
+        }
+
+        return StrokeDataset(
+            self.headers,
+            {
+                column: np.concatenate([values, batch.numeric[column]])
+                for column, values in self.numeric.items()
+            },
+            codes,
+            categories,
+            self.version,
+        )
+
+    def to_frame(self):
+        columns = {}
+        for column in self.headers:
+            if column in self.numeric:
+                columns[column] = self.numeric[column]
+            else:
+                columns[column] = pd.Categorical.from_codes(
+                    self.codes[column], self.categories[column]
+                )
+
+        return pd.DataFrame(columns)
+
+
+# Accumulate streamed chunks of rows into the columnar store
+class DatasetBuilder:
+    def __init__(self, headers):
+        self.headers = list(headers)
+        self._chunks = {column: [] for column in self.headers}
+        self._labels = {
+            column: {} for column in self.headers if column not in NUMERIC_COLUMNS
+        }
+
+    def add_columns(self, columns):
+        for column in self.headers:
+            values = columns[column]
+
+            if column in NUMERIC_COLUMNS:
+                self._chunks[column].append(
+                    np.asarray(values, dtype=NUMERIC_COLUMNS[column])
+                )
+                continue
+
+            # Encode the chunk, then map its labels onto the global codes
+            chunk_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+            if (chunk_codes < 0).any():
+                # factorize codes them as -1, which would index the last label
+                raise ValueError(f"Missing values in categorical column: {column}")
+            labels = self._labels[column]
+            lookup = np.array(
+                [labels.setdefault(label, len(labels)) for label in uniques],
+                dtype=np.int8,
+            )
+            self._chunks[column].append(lookup[chunk_codes])
+
+    def add_rows(self, rows):
+        if rows:
+            self.add_columns(dict(zip(self.headers, zip(*rows))))
+
+    def add_frame(self, df):
+        self.add_columns({column: df[column].to_numpy() for column in self.headers})
+
+    def build(self, version=1):
+        numeric = {}
+        codes = {}
+        categories = {}
+
+        for column in self.headers:
+            chunks = self._chunks[column]
+
+            if column in NUMERIC_COLUMNS:
+                dtype = NUMERIC_COLUMNS[column]
+                numeric[column] = (
+                    np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+                )
+                continue
+
+            # Remap the codes onto the fixed codes of the category registry
+            labels = self._labels[column]
+            categories[column] = registry.categories(column, labels)
+            remap = np.empty(len(labels), dtype=np.int8)
+            for label, code in labels.items():
+                remap[code] = categories[column].index(label)
+            codes[column] = (
+                remap[np.concatenate(chunks)] if chunks else np.empty(0, np.int8)
+            )
+
+        return StrokeDataset(self.headers, numeric, codes, categories, version)
+
+
+# Read the clean .csv file into the columnar store (through the binary cache)
+def load_csv_dataset(path=config.CSV_PATH, cache_dir=config.CACHE_DIR):
+    if cache_dir:
+        dataset = load_dataset_cache(cache_dir, path)
+        if dataset is not None:
+            return dataset
+
+    dtypes = {
+        column: NUMERIC_COLUMNS.get(column, "category")
+        for column in pd.read_csv(path, sep=",", nrows=0).columns
+    }
+    df = pd.read_csv(path, sep=",", dtype=dtypes)
+    dataset = StrokeDataset.from_frame(df)
+
+    if cache_dir:
+        save_dataset_cache(dataset, cache_dir, path)
+        # Serve the memory-mapped copy so that processes share its pages
+        dataset = load_dataset_cache(cache_dir, path) or dataset
+
+    return dataset
+
+
+# Fingerprint of the source file the cache was built from
+def source_info(path, with_hash=False):
+    stat = os.stat(path)
+    info = {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+    if with_hash:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as source:
+            for block in iter(lambda: source.read(1024 * 1024), b""):
+                sha256.update(block)
+        info["sha256"] = sha256.hexdigest()
+
+    return info
+
+
+# Write every column as a .npy file plus a manifest (written last)
+def save_dataset_cache(dataset, cache_dir, path):
+    os.makedirs(cache_dir, exist_ok=True)
+
+    for column in dataset.headers:
+        array = dataset.numeric.get(column)
+        if array is None:
+            array = dataset.codes[column]
+
+        # Write to a temporary file first so readers never see partial columns
+        # (named after the process: serving workers may rebuild it at once)
+        tmp_path = os.path.join(cache_dir, f"{column}.npy.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as tmp:
+            np.save(tmp, np.ascontiguousarray(array))
+        os.replace(tmp_path, os.path.join(cache_dir, f"{column}.npy"))
+
+    manifest = {
+        "format": CACHE_FORMAT,
+        "source": source_info(path, with_hash=True),
+        "headers": dataset.headers,
+        "categories": dataset.categories,
+    }
+    tmp_path = os.path.join(cache_dir, f"manifest.json.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as tmp:
+        json.dump(manifest, tmp)
+    os.replace(tmp_path, os.path.join(cache_dir, "manifest.json"))
+
+
+# Memory-map the cached columns if they were built from the current source
+def load_dataset_cache(cache_dir, path):
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    try:
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+    cached = manifest.get("source", {})
+    current = source_info(path)
+    if manifest.get("format") != CACHE_FORMAT or cached.get("path") != current["path"]:
+        return None
+
+    # Same size but touched: only trust the cache if the content hash matches
+    if (cached.get("size"), cached.get("mtime_ns")) != (
+        current["size"],
+        current["mtime_ns"],
+    ):
+        if cached.get("size") != current["size"]:
+            return None
+        if cached.get("sha256") != source_info(path, with_hash=True)["sha256"]:
+            return None
+
+    numeric = {}
+    codes = {}
+    try:
+        for column in manifest["headers"]:
+            # Plain ndarray view over the read-only memory map
+            array = np.load(
+                os.path.join(cache_dir, f"{column}.npy"), mmap_mode="r"
+            ).view(np.ndarray)
+            if column in NUMERIC_COLUMNS:
+                numeric[column] = array
+            else:
+                codes[column] = array
+    except (OSError, ValueError):
+        return None
+
+    return StrokeDataset(manifest["headers"], numeric, codes, manifest["categories"])
+
+
+# Load the dataset once from the configured backend (csv, postgres or sqlite)
+def load_dataset():
+    from functions import db_utils
+
+    return db_utils.get_backend().load_dataset()
+
+
+# Single dataset handle shared by every module of the process
+_dataset = None
+
+
+def get_dataset():
+    global _dataset
+
+    if _dataset is None:
+        # Workers attach to the columns shared by the serving process
+        from functions import shm_utils
+
+        _dataset = shm_utils.shared_dataset() or load_dataset()
+
+    return _dataset
+
+
+def set_dataset(dataset):
+    global _dataset
 
-        # Create a cursor object
-        cur = conn.cursor()
+    _dataset = dataset
 
-        # Execute a query to fetch file number, gender, and diseases
-        cur.execute("SELECT * FROM public.stroke_data")
 
-        # Fetch all rows from the result set
-        rows = cur.fetchall()
-        headers = [desc[0] for desc in cur.description]
+# Load the data again and replace the shared handle (workers attach the latest
+# version shared by the serving process instead)
+def reload_dataset():
+    global _dataset
+    from functions import shm_utils
 
-        # Close the cursor and connection
-        cur.close()
-        conn.close()
+    shared = shm_utils.shared_dataset()
+    if shared is not None:
+        _dataset = shared
+        return _dataset
 
-        # Return the fetched data and headers
-        return rows, headers
+    version = _dataset.version + 1 if _dataset is not None else 1
+    _dataset = load_dataset()
+    _dataset.version = version
 
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(error) """
+    return _dataset
 
 
-# Alternatively, can directly read data from a .csv file
+# Rows and headers of the dataset as plain arrays
 def fetch_selected_data():
-    df = pd.read_csv("datasets/healthcare_stroke_dataset_clean.csv", sep=",")
+    df = get_dataset().to_frame()
 
     rows = df.values
     headers = df.columns.tolist()
@@ -0,0 +1,376 @@
+# Import the necessary libraries
+import contextlib
+import io
+import math
+import queue
+import re
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psycopg2
+    from psycopg2 import pool as psycopg2_pool
+except ImportError:  # only needed by the postgres backend
+    psycopg2 = None
+
+from functions import config
+from functions.category_utils import CATEGORY_LABELS
+from functions.data_utils import NUMERIC_COLUMNS, DatasetBuilder, load_csv_dataset
+
+# Constraint violations of the database backends (e.g. a duplicate id)
+INTEGRITY_ERRORS = (sqlite3.IntegrityError,)
+if psycopg2 is not None:
+    INTEGRITY_ERRORS += (psycopg2.IntegrityError,)
+
+# Columns of public.stroke_data (see datasets/stroke_db.sql)
+STROKE_COLUMNS = [
+    "id",
+    "gender",
+    "age",
+    "hypertension",
+    "heart_disease",
+    "ever_married",
+    "work_type",
+    "residence_type",
+    "avg_glucose_level",
+    "bmi",
+    "smoking_status",
+    "stroke",
+]
+
+
+# Read the clean .csv file
+class CsvBackend:
+    def __init__(self, path=config.CSV_PATH):
+        self.path = path
+
+    def load_dataset(self):
+        return load_csv_dataset(self.path)
+
+    def close(self):
+        pass
+
+
+# Shared logic of the database backends: stream rows in chunks into columns
+class SqlBackend:
+    table = "stroke_data"
+    chunk_size = config.DB_CHUNK_SIZE
+    dialect = None
+    placeholder = "?"
+
+    def connection(self):
+        raise NotImplementedError
+
+    def _cursor(self, conn):
+        return contextlib.closing(conn.cursor())
+
+    def insert_rows(self, rows):
+        sql = (
+            f"INSERT INTO {self.table} ({', '.join(STROKE_COLUMNS)}) "
+            f"VALUES ({', '.join([self.placeholder] * len(STROKE_COLUMNS))})"
+        )
+
+        # All the rows or none (e.g. one of them has an existing id)
+        with self.connection() as conn:
+            try:
+                with contextlib.closing(conn.cursor()) as cur:
+                    cur.executemany(sql, rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def query(self, sql, params=()):
+        # Small result sets only (aggregates), fetched on a client-side cursor
+        with self.connection() as conn:
+            with contextlib.closing(conn.cursor()) as cur:
+                cur.execute(sql, params)
+                return cur.fetchall()
+
+    def load_dataset(self):
+        builder = DatasetBuilder(STROKE_COLUMNS)
+        query = f"SELECT {', '.join(STROKE_COLUMNS)} FROM {self.table}"
+
+        with self.connection() as conn:
+            with self._cursor(conn) as cur:
+                cur.execute(query)
+
+                # Never hold more than one chunk of rows as Python tuples
+                while True:
+                    rows = cur.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    builder.add_rows(rows)
+
+        return builder.build()
+
+
+# PostgreSQL backend with a thread-safe connection pool
+class PostgresBackend(SqlBackend):
+    dialect = "postgres"
+    placeholder = "%s"
+
+    def __init__(
+        self,
+        params=None,
+        table=config.POSTGRES_TABLE,
+        min_connections=config.DB_MIN_CONNECTIONS,
+        max_connections=config.DB_MAX_CONNECTIONS,
+        chunk_size=config.DB_CHUNK_SIZE,
+        method=config.POSTGRES_FETCH_METHOD,
+    ):
+        if psycopg2 is None:
+            raise ImportError("psycopg2 is required for the postgres backend")
+
+        self.table = table
+        self.chunk_size = chunk_size
+        self.method = method
+        self.pool = psycopg2_pool.ThreadedConnectionPool(
+            min_connections, max_connections, **(params or config.POSTGRES)
+        )
+        # getconn raises once the pool is exhausted: wait for a free slot instead
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    @contextlib.contextmanager
+    def connection(self):
+        with self._slots:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+            finally:
+                # End the read transaction before handing the connection back
+                conn.rollback()
+                self.pool.putconn(conn)
+
+    def _cursor(self, conn):
+        # Named (server-side) cursor: rows stay on the server until fetched
+        cur = conn.cursor(name="stroke_data_stream")
+        cur.itersize = self.chunk_size
+        return cur
+
+    def load_dataset(self):
+        if self.method == "copy":
+            return self._copy_dataset()
+
+        return super().load_dataset()
+
+    def _copy_dataset(self):
+        builder = DatasetBuilder(STROKE_COLUMNS)
+        writer = CsvChunkWriter(builder, STROKE_COLUMNS)
+        query = (
+            f"COPY (SELECT {', '.join(STROKE_COLUMNS)} FROM {self.table}) "
+            "TO STDOUT WITH (FORMAT csv)"
+        )
+
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.copy_expert(query, writer)
+        writer.flush()
+
+        return builder.build()
+
+    def close(self):
+        self.pool.closeall()
+
+
+# Decode a COPY ... TO STDOUT csv stream chunk by chunk into the builder
+class CsvChunkWriter:
+    def __init__(self, builder, headers, chunk_bytes=8 * 1024 * 1024):
+        self.builder = builder
+        self.headers = headers
+        self.chunk_bytes = chunk_bytes
+        self._buffer = bytearray()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._buffer.extend(data)
+
+        # Only parse complete lines, keep the tail for the next write
+        if len(self._buffer) >= self.chunk_bytes:
+            end = self._buffer.rfind(b"\n") + 1
+            self._parse(bytes(self._buffer[:end]))
+            del self._buffer[:end]
+
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._parse(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _parse(self, chunk):
+        if not chunk:
+            return
+
+        dtypes = {column: NUMERIC_COLUMNS.get(column, str) for column in self.headers}
+        df = pd.read_csv(
+            io.BytesIO(chunk), header=None, names=self.headers, dtype=dtypes
+        )
+        self.builder.add_frame(df)
+
+
+# SQLite stand-in for the PostgreSQL database (e.g. for local testing)
+class SqliteBackend(SqlBackend):
+    dialect = "sqlite"
+
+    def __init__(
+        self,
+        path=config.SQLITE_PATH,
+        max_connections=config.DB_MAX_CONNECTIONS,
+        chunk_size=config.DB_CHUNK_SIZE,
+    ):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.max_connections = max_connections
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.max_connections:
+                self._created += 1
+                return sqlite3.connect(self.path, check_same_thread=False)
+
+        # Pool exhausted, wait for a connection to be released
+        return self._idle.get()
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+# Rows (dicts keyed by column, or sequences in STROKE_COLUMNS order) as tuples.
+# Every row is checked before any is returned, so a bad batch changes nothing:
+# numbers in the numeric columns and known labels in the categorical ones.
+def normalize_rows(rows):
+    if not isinstance(rows, list):
+        raise ValueError("Expected a list of rows")
+
+    normalized = []
+    for number, row in enumerate(rows):
+        if isinstance(row, dict):
+            missing = [column for column in STROKE_COLUMNS if column not in row]
+            if missing:
+                raise ValueError(f"Row {number}: missing columns: {', '.join(missing)}")
+            row = [row[column] for column in STROKE_COLUMNS]
+        elif not isinstance(row, (list, tuple)) or len(row) != len(STROKE_COLUMNS):
+            raise ValueError(
+                f"Row {number}: expected {len(STROKE_COLUMNS)} values or an object"
+            )
+
+        for column, value in zip(STROKE_COLUMNS, row):
+            try:
+                check_value(column, value)
+            except (TypeError, ValueError) as error:
+                raise ValueError(f"Row {number}, {column}: {error}") from None
+        normalized.append(tuple(row))
+
+    return normalized
+
+
+# Range of the integer columns of stroke_data
+INTEGER_RANGE = (-(2**31), 2**31 - 1)
+
+
+def check_value(column, value):
+    if value is None:
+        raise ValueError("missing value")
+
+    if column in NUMERIC_COLUMNS:
+        integer = NUMERIC_COLUMNS[column] == np.int64
+        types = int if integer else (int, float)
+        if isinstance(value, bool) or not isinstance(value, types):
+            kind = "an integer" if integer else "a number"
+            raise TypeError(f"expected {kind}, got {type(value).__name__}")
+        if not math.isfinite(value):
+            raise ValueError(f"not a finite number: {value!r}")
+        if integer and not INTEGER_RANGE[0] <= value <= INTEGER_RANGE[1]:
+            raise ValueError(f"out of range: {value}")
+    elif not isinstance(value, str):
+        raise TypeError(f"expected a label, got {type(value).__name__}")
+    elif value not in CATEGORY_LABELS[column]:
+        raise ValueError(f"unknown label: {value!r}")
+
+
+BACKENDS = {
+    "csv": CsvBackend,
+    "postgres": PostgresBackend,
+    "sqlite": SqliteBackend,
+}
+
+_backend = None
+
+
+# Backend selected by config.DATA_BACKEND, created once per process
+def get_backend():
+    global _backend
+
+    if _backend is None:
+        if config.DATA_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown data backend: {config.DATA_BACKEND}")
+        _backend = BACKENDS[config.DATA_BACKEND]()
+
+    return _backend
+
+
+# Restore the stroke_data table of a pg_dump file into a SQLite database
+def create_sqlite_from_dump(
+    dump_path="datasets/stroke_db.sql", sqlite_path=config.SQLITE_PATH
+):
+    sql_types = {"integer": "INTEGER", "double precision": "REAL"}
+
+    with open(dump_path, encoding="utf-8") as dump:
+        text = dump.read()
+
+    # Column definitions of the CREATE TABLE statement
+    create = re.search(r"CREATE TABLE public\.stroke_data \((.*?)\);", text, re.S)
+    columns = []
+    for line in create.group(1).strip().splitlines():
+        name, definition = line.strip().rstrip(",").split(" ", 1)
+        sql_type = next(
+            (sql_types[key] for key in sql_types if definition.startswith(key)),
+            "TEXT",
+        )
+        columns.append(f"{name} {sql_type} NOT NULL")
+
+    # Same primary key as the postgres table
+    constraints = []
+    key = re.search(r"stroke_data\s+ADD CONSTRAINT \w+ PRIMARY KEY \((\w+)\)", text)
+    if key:
+        constraints.append(f"PRIMARY KEY ({key.group(1)})")
+
+    # Tab separated rows of the COPY ... FROM stdin block
+    copy = re.search(
+        r"COPY public\.stroke_data \(.*?\) FROM stdin;\n(.*?)\n\\\.", text, re.S
+    )
+    rows = [line.split("\t") for line in copy.group(1).splitlines()]
+
+    conn = sqlite3.connect(sqlite_path)
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS stroke_data")
+        conn.execute(f"CREATE TABLE stroke_data ({', '.join(columns + constraints)})")
+        conn.executemany(
+            f"INSERT INTO stroke_data VALUES ({', '.join('?' * len(columns))})",
+            rows,
+        )
+    conn.close()
+
+    return sqlite_path
@@ -0,0 +1,219 @@
+# Import the necessary libraries
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from functions.aggregate_utils import AggregateCube
+from functions.data_utils import StrokeDataset
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for the parquet output
+    pa = pq = None
+
+# Raw extract read by the clean-up step, and where the clean data goes
+RAW_CSV_PATH = "datasets/healthcare_stroke_dataset.csv"
+CLEAN_CSV_PATH = "datasets/healthcare_stroke_dataset_clean.csv"
+
+# Types of the raw numeric columns (fixed so every chunk parses the same way;
+# the 0/1 flags are read as floats so that missing values parse)
+RAW_DTYPES = {
+    "id": np.int64,
+    "age": np.float64,
+    "hypertension": np.float64,
+    "heart_disease": np.float64,
+    "avg_glucose_level": np.float64,
+    "bmi": np.float64,
+    "stroke": np.float64,
+}
+
+# 0/1 flags of the raw data, written as No/Yes
+FLAG_COLUMNS = ["hypertension", "heart_disease", "stroke"]
+
+OUTPUT_FORMATS = ["csv", "parquet"]
+
+
+# Cleaning rules of data_clean_up.ipynb, applied to one chunk of raw rows
+def clean_chunk(df):
+    # Remove rows where there is a null value
+    df = df.dropna(axis=0)
+
+    # Rename the columns of older extracts (Residence_type)
+    df = df.rename(columns={"Residence_type": "residence_type"})
+
+    # Convert columns
+    df["age"] = df["age"].astype("int")
+    for column in FLAG_COLUMNS:
+        df[column] = np.where(df[column] == 0, "No", "Yes")
+
+    return df
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8", newline="")
+        self._header = True
+
+    def write(self, df):
+        df.to_csv(self._file, sep=",", index=False, header=self._header)
+        self._header = False
+
+    def close(self):
+        # Publish the file only once it is complete
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+
+class ParquetSink:
+    def __init__(self, path):
+        if pq is None:
+            raise RuntimeError("pyarrow is required for parquet output")
+
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._writer = None
+
+    def write(self, df):
+        # One row group per chunk
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._tmp_path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self._writer is None:
+            return
+
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+
+SINKS = {"csv": CsvSink, "parquet": ParquetSink}
+
+
+# One output file per value of a column (e.g. clean/stroke=Yes.csv)
+class PartitionedSink:
+    def __init__(self, directory, column, output_format):
+        self.directory = directory
+        self.column = column
+        self.output_format = output_format
+        self._sinks = {}
+
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, df):
+        for value, part in df.groupby(self.column, sort=False):
+            sink = self._sinks.get(value)
+            if sink is None:
+                path = os.path.join(
+                    self.directory, f"{self.column}={value}.{self.output_format}"
+                )
+                sink = self._sinks[value] = SINKS[self.output_format](path)
+            sink.write(part)
+
+    def close(self):
+        for sink in self._sinks.values():
+            sink.close()
+
+
+def open_sink(output, output_format="csv", partition_by=None):
+    if output_format not in SINKS:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+    if partition_by:
+        return PartitionedSink(output, partition_by, output_format)
+
+    return SINKS[output_format](output)
+
+
+# Stream the raw csv through the cleaning rules, chunk by chunk, so memory use
+# does not depend on the size of the extract. Optionally also accumulate the
+# dashboard's aggregate cube (group-by counts, age histograms, glucose and BMI
+# sketches) and write it as JSON. Returns (rows read, rows written).
+def clean_csv(
+    source=RAW_CSV_PATH,
+    output=CLEAN_CSV_PATH,
+    chunk_size=100_000,
+    output_format="csv",
+    partition_by=None,
+    aggregates_path=None,
+):
+    header = pd.read_csv(source, sep=",", nrows=0).columns
+    dtypes = {column: RAW_DTYPES[column] for column in header if column in RAW_DTYPES}
+
+    sink = open_sink(output, output_format, partition_by)
+    cube = None
+    rows_read = rows_written = 0
+
+    chunks = pd.read_csv(source, sep=",", dtype=dtypes, chunksize=chunk_size)
+    for chunk in chunks:
+        rows_read += len(chunk)
+        clean = clean_chunk(chunk)
+        if clean.empty:
+            continue
+
+        sink.write(clean)
+        rows_written += len(clean)
+
+        if aggregates_path:
+            batch = StrokeDataset.from_frame(clean)
+            if cube is None:
+                cube = AggregateCube.from_dataset(batch)
+            else:
+                cube = cube.append(batch)
+
+    sink.close()
+
+    if aggregates_path and cube is not None:
+        write_aggregates(cube, aggregates_path)
+
+    return rows_read, rows_written
+
+
+def write_aggregates(cube, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as output:
+        json.dump(cube.to_dict(), output)
+    os.replace(tmp_path, path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Clean the raw stroke dataset in streamed chunks"
+    )
+    parser.add_argument("source", nargs="?", default=RAW_CSV_PATH)
+    parser.add_argument(
+        "output",
+        nargs="?",
+        default=CLEAN_CSV_PATH,
+        help="output file (a directory when partitioning)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv")
+    parser.add_argument("--partition-by", help="e.g. stroke")
+    parser.add_argument("--aggregates", help="also write the aggregates (JSON)")
+    return parser.parse_args()
+
+
+# python -m functions.etl_utils datasets/raw.csv datasets/clean.csv
+def main():
+    args = parse_args()
+    rows_read, rows_written = clean_csv(
+        args.source,
+        args.output,
+        args.chunk_size,
+        args.format,
+        args.partition_by,
+        args.aggregates,
+    )
+    print(f"{rows_read} rows read, {rows_written} clean rows written")
+
+
+if __name__ == "__main__":
+    main()
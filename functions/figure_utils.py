@@ -0,0 +1,376 @@
+# Import the necessary libraries
+import argparse
+import base64
+import json
+import math
+import time
+import tracemalloc
+
+import numpy as np
+import plotly.graph_objects as go
+
+from functions import config
+from functions.aggregate_utils import AGE_BUCKET_WIDTH
+from functions.category_utils import registry
+from functions.spec_utils import BOX_MODE, CHARTS, STROKE_CLASSES
+
+
+# Layout of a panel as go.Figure builds it (plotly's default template
+# included), computed and serialized once per panel
+class LayoutTemplate:
+    def __init__(self, spec):
+        figure = go.Figure().update_layout(**spec.layout())
+        self.layout = figure.to_plotly_json()["layout"]
+        self.json = json.dumps(self.layout)
+
+
+_templates = {}
+
+
+def layout_template(spec):
+    template = _templates.get(spec.name)
+    if template is None:
+        template = _templates[spec.name] = LayoutTemplate(spec)
+
+    return template
+
+
+# Figure dict ({"data": [...], "layout": {...}}) whose layout starts as a
+# shallow copy of its template: replace its entries, never edit them in place.
+# Serialized with the template's JSON while the layout is unchanged.
+class DictFigure(dict):
+    def __init__(self, data, template):
+        super().__init__(data=data, layout=dict(template.layout))
+        self.template = template
+
+    def to_plotly_json(self):
+        return self
+
+    def to_json(self):
+        if self["layout"] != self.template.layout:
+            return json.dumps(self)
+
+        return f'{{"data": {json.dumps(self["data"])}, "layout": {self.template.json}}}'
+
+
+def plain(values):
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+
+# Trace of the given type, without its unset (None) properties
+def trace(kind, **properties):
+    properties = {
+        name: value for name, value in properties.items() if value is not None
+    }
+    properties["type"] = kind
+    return properties
+
+
+# 95% margins of error of counts estimated from the stratified sample (None
+# for exact counts)
+def estimate_margins(source, counts, stroke_value):
+    if not getattr(source, "approximate", False):
+        return None
+
+    return source.margins(counts, stroke_value)
+
+
+def estimate_hover(counts, margins):
+    if margins is None:
+        return None
+
+    return [
+        f"≈ {count:,} ± {margin:,.0f} (95% CI)"
+        for count, margin in zip(counts, margins)
+    ]
+
+
+def label_colors(spec, labels):
+    if spec.colors == "registry":
+        return registry.colors(spec.column, labels)
+
+    return None
+
+
+def colors_marker(spec, labels):
+    colors = label_colors(spec, labels)
+    return None if colors is None else {"colors": plain(colors)}
+
+
+### Traces
+def pie_traces(spec, source, stroke_value):
+    labels, counts = source.value_counts(spec.column, stroke_value)
+    hover = estimate_hover(counts, estimate_margins(source, counts, stroke_value))
+
+    return [
+        trace(
+            "pie",
+            labels=plain(labels),
+            values=plain(counts),
+            marker=colors_marker(spec, labels),
+            hovertext=hover,
+            hole=0.6,
+        )
+    ]
+
+
+def treemap_traces(spec, source, stroke_value):
+    labels, counts = source.value_counts(spec.column, stroke_value)
+    hover = estimate_hover(counts, estimate_margins(source, counts, stroke_value))
+
+    return [
+        trace(
+            "treemap",
+            labels=plain(labels),
+            parents=[""] * len(labels),
+            values=plain(counts),
+            marker=colors_marker(spec, labels),
+            hovertext=hover,
+            textinfo="label+value+percent root",
+        )
+    ]
+
+
+def bar_traces(spec, source, stroke_value, width=AGE_BUCKET_WIDTH):
+    age_groups, age_counts = source.age_group_counts(stroke_value, width)
+    margins = estimate_margins(source, age_counts, stroke_value)
+    counts = plain(age_counts)
+
+    return [
+        trace(
+            "bar",
+            x=plain(age_groups),
+            y=counts,
+            text=counts,
+            textposition="auto",
+            hovertext=estimate_hover(age_counts, margins),
+            error_y=(
+                None if margins is None else {"type": "data", "array": plain(margins)}
+            ),
+        )
+    ]
+
+
+def box_traces(spec, source, stroke_value=None, mode=BOX_MODE):
+    traces = []
+    for value, name in STROKE_CLASSES:
+        traces += box_class_traces(
+            source, spec.column, value, name, spec.colors[value], mode
+        )
+
+    return traces
+
+
+def box_class_traces(source, column, stroke_value, name, color, mode):
+    marker = {"color": color}
+    if mode == "raw":
+        values = plain(source.values(column, stroke_value))
+        return [trace("box", y=values, name=name, marker=marker)]
+
+    stats = source.box_stats(column, stroke_value)
+    if stats is None:
+        return [trace("box", y=[], name=name, marker=marker)]
+
+    outliers = plain(stats["outliers"])
+    traces = [
+        trace(
+            "box",
+            x=[name],
+            q1=[float(stats["q1"])],
+            median=[float(stats["median"])],
+            q3=[float(stats["q3"])],
+            lowerfence=[float(stats["lowerfence"])],
+            upperfence=[float(stats["upperfence"])],
+            mean=[float(stats["mean"])],
+            name=name,
+            legendgroup=name,
+            marker=marker,
+            boxpoints=False,
+        ),
+        trace(
+            "scatter",
+            x=[name] * len(outliers),
+            y=outliers,
+            mode="markers",
+            name=name,
+            legendgroup=name,
+            marker=marker,
+            showlegend=False,
+        ),
+    ]
+
+    if "median_interval" in stats:
+        low, high = stats["median_interval"]
+        median = float(stats["median"])
+        traces.append(
+            trace(
+                "scatter",
+                x=[name],
+                y=[median],
+                mode="markers",
+                error_y={
+                    "type": "data",
+                    "symmetric": False,
+                    "array": [high - median],
+                    "arrayminus": [median - low],
+                },
+                hovertext=[
+                    f"median ≈ {median:.1f} (95% CI {low:.1f} - {high:.1f}), "
+                    f"n ≈ {stats['count']:,}"
+                ],
+                hoverinfo="text",
+                name=name,
+                legendgroup=name,
+                marker=marker,
+                showlegend=False,
+            )
+        )
+
+    return traces
+
+
+TRACES = {
+    "pie": pie_traces,
+    "treemap": treemap_traces,
+    "bar": bar_traces,
+    "box": box_traces,
+}
+
+
+# Values of config.FIGURE_BUILDER
+FIGURE_BUILDERS = ("dict", "graph_objects")
+
+
+def build_dict_chart(spec, source, stroke_value=None, **options):
+    traces = TRACES[spec.kind](spec, source, stroke_value, **options)
+    return DictFigure(traces, layout_template(spec))
+
+
+# Figure of a panel from any source with the cube's interface (cube, filtered
+# view, sample, SQL aggregates). Options go to the trace builder (e.g. the
+# age bucket width, the box mode). The dict figure skips plotly's property
+# validators; config.FIGURE_BUILDER = "graph_objects" wraps it in a go.Figure.
+# With config.VERIFY_FIGURES it is checked by go.Figure's validators.
+def build_chart(spec, source, stroke_value=None, **options):
+    figure = build_dict_chart(spec, source, stroke_value, **options)
+    if config.VERIFY_FIGURES:
+        verify_figure(figure)
+
+    if config.FIGURE_BUILDER == "graph_objects":
+        return go.Figure(figure)
+    return figure
+
+
+### Validation with go.Figure
+# Parsed figure JSON with plotly's typed arrays ({"dtype", "bdata"}) decoded,
+# numbers as floats, NaN as null and empty objects dropped
+def comparable(value):
+    if isinstance(value, dict):
+        if "dtype" in value and "bdata" in value:
+            array = np.frombuffer(base64.b64decode(value["bdata"]), value["dtype"])
+            return [comparable(item) for item in array.tolist()]
+        return {name: comparable(item) for name, item in value.items() if item != {}}
+    if isinstance(value, list):
+        return [comparable(item) for item in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return None if math.isnan(value) else float(value)
+
+    return value
+
+
+# Path of the first difference between two comparable figures (None if equal)
+def first_difference(value, reference, path="figure"):
+    if isinstance(value, dict) and isinstance(reference, dict):
+        for name in sorted(set(value) | set(reference)):
+            if name not in value or name not in reference:
+                return f"{path}.{name}"
+            difference = first_difference(
+                value[name], reference[name], f"{path}.{name}"
+            )
+            if difference is not None:
+                return difference
+        return None
+
+    if isinstance(value, list) and isinstance(reference, list):
+        if len(value) != len(reference):
+            return f"{path} (length {len(value)} != {len(reference)})"
+        for position, (item, reference_item) in enumerate(zip(value, reference)):
+            difference = first_difference(item, reference_item, f"{path}[{position}]")
+            if difference is not None:
+                return difference
+        return None
+
+    return None if value == reference else f"{path} ({value!r} != {reference!r})"
+
+
+# go.Figure runs plotly's validators over the dict figure (raising on unknown
+# properties or invalid values); the validated layout must match the
+# panel's template. Trace values are left to the validators, which coerce
+# some of them (e.g. a list of bar texts to strings).
+def verify_figure(figure):
+    layout = go.Figure(figure).to_plotly_json()["layout"]
+    difference = first_difference(
+        comparable(json.loads(json.dumps(figure["layout"]))),
+        comparable(json.loads(json.dumps(layout))),
+        "figure.layout",
+    )
+    if difference is not None:
+        raise ValueError(f"Figure differs from its go.Figure at {difference}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Check the dict figures with go.Figure and time both"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    return parser.parse_args()
+
+
+# Best time (ms) and peak allocation (KiB) of building and serializing a figure
+def measure(build, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build().to_json()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    build().to_json()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(timings) * 1000, peak / 1024
+
+
+# python -m functions.figure_utils (DASHBOARD_* variables select the data)
+def main():
+    args = parse_args()
+
+    from functions import chart_utils
+
+    snapshot = chart_utils.current()
+    for graph_id, spec in CHARTS.items():
+        source = snapshot.stats_source
+        if spec.aggregation != "box_stats":
+            source = snapshot.aggregates
+
+        for value in ["No", "Yes"] if spec.dropdown else [None]:
+
+            def build():
+                return build_dict_chart(spec, source, value)
+
+            verify_figure(build())
+
+            label = graph_id if value is None else f"{graph_id} ({value})"
+            results = [
+                measure(lambda: go.Figure(build()), args.repeat),
+                measure(build, args.repeat),
+            ]
+            print(
+                f"{label}: go.Figure {results[0][0]:.2f} ms / {results[0][1]:.0f} KiB, "
+                f"dict {results[1][0]:.2f} ms / {results[1][1]:.0f} KiB, valid"
+            )
+
+
+if __name__ == "__main__":
+    main()
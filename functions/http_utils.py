@@ -0,0 +1,65 @@
+# Import the necessary libraries
+import gzip
+
+from functions import config
+
+try:
+    import brotli
+except ImportError:  # gzip only without the brotli package
+    brotli = None
+
+# Response types worth compressing (figure JSON, the page and its assets)
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "application/javascript",
+    "text/javascript",
+)
+
+
+# Best encoding accepted by the client, None to send the body as is
+def negotiate_encoding(accept_encodings):
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=config.BROTLI_QUALITY)
+
+    return gzip.compress(body, compresslevel=config.GZIP_LEVEL)
+
+
+def is_compressible(response):
+    return (
+        response.status_code == 200
+        and not response.direct_passthrough  # files streamed from disk
+        and "Content-Encoding" not in response.headers
+        and response.mimetype in COMPRESSIBLE_TYPES
+    )
+
+
+# Compress the responses of the Flask server (gzip or brotli)
+def install(server):
+    from flask import request
+
+    @server.after_request
+    def compress_response(response):
+        if not config.COMPRESSION or not is_compressible(response):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        body = response.get_data()
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None or len(body) < config.COMPRESSION_MIN_BYTES:
+            return response
+
+        response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
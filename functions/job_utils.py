@@ -0,0 +1,82 @@
+# Import the necessary libraries
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import diskcache
+except ImportError:  # only needed for background callbacks
+    diskcache = None
+
+
+# Pool for the expensive panels that runs identical in-flight jobs only once:
+# requests with the same key while a job is running wait on the same future
+class JobQueue:
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._executor = None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, *args, **kwargs):
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+
+            # Created lazily so forked server workers each get their own pool
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="panel-job"
+                )
+            future = self._executor.submit(func, *args, **kwargs)
+            self._in_flight[key] = future
+
+        # Outside the lock: the callback runs at once if the job already ended
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def run(self, key, func, *args, **kwargs):
+        return self.submit(key, func, *args, **kwargs).result()
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._in_flight)
+
+
+# Cross-process variant for background callbacks (each job runs in its own
+# process): the first job with a key computes the result under a diskcache
+# lock, the others wait for the lock and read the stored result
+class DiskJobQueue:
+    def __init__(self, directory, expire=3600):
+        if diskcache is None:
+            raise RuntimeError("diskcache is required: pip install diskcache")
+
+        self.cache = diskcache.Cache(directory)
+        self.expire = expire
+
+    def run(self, key, func, *args, **kwargs):
+        key = repr(key)
+        result = self.cache.get(key)
+        if result is None:
+            with diskcache.Lock(self.cache, f"lock:{key}", expire=self.expire):
+                result = self.cache.get(key)
+                if result is None:
+                    result = func(*args, **kwargs)
+                    self.cache.set(key, result, expire=self.expire)
+
+        return result
+
+
+# Dash manager running background callbacks in separate processes, no broker
+def background_callback_manager(directory):
+    if diskcache is None:
+        raise RuntimeError("diskcache is required: pip install diskcache")
+
+    from dash import DiskcacheManager
+
+    return DiskcacheManager(diskcache.Cache(directory))
@@ -0,0 +1,82 @@
+# Key figures shown above the charts. Each one is read from counters the data
+# sources maintain (the cube's group-by counts and sketch sums, updated when
+# rows are ingested, or one aggregate query under pushdown), so they do not
+# scan the rows; cross-filtered values come from the bitmap indexes (or from
+# queries on the filtered rows under pushdown).
+
+
+class Kpi:
+    def __init__(self, title, compute, class_name="kpi-generic", fmt="{}"):
+        self.title = title
+        self.compute = compute  # source -> value (None when not available)
+        self.class_name = class_name
+        self.fmt = fmt
+
+    def value(self, source):
+        value = self.compute(source)
+        if value is None:
+            return "-"
+
+        return self.fmt.format(value)
+
+
+def total(source):
+    return source.stroke_counts()[0]
+
+
+def stroke(source):
+    return source.stroke_counts()[1]
+
+
+def no_stroke(source):
+    return source.stroke_counts()[2]
+
+
+# Share of the patients with column == "Yes", over both stroke classes
+def rate(column):
+    def compute(source):
+        positive = count = 0
+        for stroke_value in ("Yes", "No"):
+            labels, counts = source.value_counts(column, stroke_value)
+            by_label = dict(zip(labels, counts))
+            positive += by_label.get("Yes", 0)
+            count += sum(by_label.values())
+
+        return positive / count if count else None
+
+    return compute
+
+
+def mean(column, stroke_value):
+    def compute(source):
+        return source.mean(column, stroke_value)
+
+    return compute
+
+
+# Every available KPI, in display order. The cards shown are chosen with
+# config.KPIS (DASHBOARD_KPIS).
+KPIS = {
+    "kpi-total": Kpi("Total patients", total),
+    "kpi-no-stroke": Kpi("Healthy", no_stroke, "kpi-no-stroke"),
+    "kpi-stroke": Kpi("Stroke", stroke, "kpi-stroke"),
+    "kpi-hypertension-rate": Kpi("Hypertension", rate("hypertension"), fmt="{:.1%}"),
+    "kpi-heart-disease-rate": Kpi("Heart disease", rate("heart_disease"), fmt="{:.1%}"),
+    "kpi-glucose-no-stroke": Kpi(
+        "Glucose (healthy)",
+        mean("avg_glucose_level", "No"),
+        "kpi-no-stroke",
+        "{:.1f} mg/dL",
+    ),
+    "kpi-glucose-stroke": Kpi(
+        "Glucose (stroke)",
+        mean("avg_glucose_level", "Yes"),
+        "kpi-stroke",
+        "{:.1f} mg/dL",
+    ),
+}
+
+
+# Values of the selected KPIs for one data source, in the same order
+def compute_kpis(source, kpi_ids):
+    return [KPIS[kpi_id].value(source) for kpi_id in kpi_ids]
@@ -0,0 +1,308 @@
+# Import the necessary libraries
+import cProfile
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+from functions import config
+
+# Histogram buckets (upper bounds) for durations and sizes
+SECONDS_BUCKETS = [
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+]
+BYTES_BUCKETS = [2.0**power for power in range(10, 31, 2)]  # 1 KiB to 1 GiB
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Prometheus histogram with one series per combination of label values
+class Histogram:
+    def __init__(self, name, documentation, buckets, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = np.array(buckets, dtype=np.float64)
+        self.label_names = tuple(label_names)
+        self._series = {}  # label values -> [bucket counts, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        position = np.searchsorted(self.buckets, value, side="left")
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [
+                    np.zeros(len(self.buckets) + 1, dtype=np.int64),
+                    0.0,
+                ]
+            series[0][position] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(
+                (values, counts.copy(), total)
+                for values, (counts, total) in self._series.items()
+            )
+
+        for label_values, counts, total in series:
+            labels = [
+                f'{name}="{escape(value)}"'
+                for name, value in zip(self.label_names, label_values)
+            ]
+            cumulative = np.cumsum(counts)
+            bounds = [format_float(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, cumulative):
+                bucket_labels = ",".join(labels + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {count}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {format_float(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative[-1]}")
+
+        return lines
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_float(value):
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name, documentation, buckets, label_names=()):
+        metric = Histogram(name, documentation, buckets, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+CALLBACK_SECONDS = registry.histogram(
+    "dashboard_callback_seconds",
+    "Wall time of the Dash callback requests.",
+    SECONDS_BUCKETS,
+    ("callback",),
+)
+CALLBACK_PAYLOAD_BYTES = registry.histogram(
+    "dashboard_callback_payload_bytes",
+    "Size of the Dash callback responses, before compression.",
+    BYTES_BUCKETS,
+    ("callback",),
+)
+CALLBACK_ALLOCATED_BYTES = registry.histogram(
+    "dashboard_callback_allocated_bytes",
+    "Peak memory allocated while serving a callback (tracemalloc).",
+    BYTES_BUCKETS,
+    ("callback",),
+)
+STAGE_SECONDS = registry.histogram(
+    "dashboard_stage_seconds",
+    "Wall time of each stage, excluding the nested stages.",
+    SECONDS_BUCKETS,
+    ("stage",),
+)
+STAGE_ALLOCATED_BYTES = registry.histogram(
+    "dashboard_stage_allocated_bytes",
+    "Peak memory allocated during each stage, nested stages included (tracemalloc).",
+    BYTES_BUCKETS,
+    ("stage",),
+)
+
+
+# Started at import so that loading the data is traced too
+if config.TRACE_ALLOCATIONS and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+# Stack of the stages running in the current thread
+_local = threading.local()
+
+
+class _Frame:
+    __slots__ = ("start", "nested_seconds", "start_memory", "peak_memory")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.nested_seconds = 0.0
+        self.start_memory = None
+        self.peak_memory = 0
+
+        if tracemalloc.is_tracing():
+            # The peak is process-wide: concurrent requests inflate each other
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+
+def _enter():
+    frame = _Frame()
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(frame)
+
+    return frame
+
+
+# Elapsed seconds and allocated bytes (None when not tracing) of a frame
+def _exit(frame):
+    elapsed = time.perf_counter() - frame.start
+    stack = _local.stack
+    stack.remove(frame)
+
+    allocated = None
+    if frame.start_memory is not None and tracemalloc.is_tracing():
+        frame.peak_memory = max(frame.peak_memory, tracemalloc.get_traced_memory()[1])
+        allocated = max(frame.peak_memory - frame.start_memory, 0)
+
+    if stack:
+        parent = stack[-1]
+        parent.nested_seconds += elapsed
+        parent.peak_memory = max(parent.peak_memory, frame.peak_memory)
+
+    return elapsed, allocated
+
+
+# Record the wall time and allocations of a block of code as a stage:
+# "load", "filter", "aggregation", "figure", "serialization"
+@contextmanager
+def stage(name):
+    frame = _enter()
+    try:
+        yield
+    finally:
+        elapsed, allocated = _exit(frame)
+        STAGE_SECONDS.observe(elapsed - frame.nested_seconds, name)
+        if allocated is not None:
+            STAGE_ALLOCATED_BYTES.observe(allocated, name)
+
+
+# Data source whose method calls are recorded as a stage (e.g. the aggregate
+# cube, the filtered views or the SQL aggregates, timed as "aggregation")
+class InstrumentedSource:
+    def __init__(self, source, stage_name="aggregation"):
+        self._source = source
+        self._stage_name = stage_name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._source, name)
+        if not callable(attribute):
+            return attribute
+
+        def instrumented(*args, **kwargs):
+            with stage(self._stage_name):
+                return attribute(*args, **kwargs)
+
+        return instrumented
+
+
+# Dash encodes the callback responses (figures included) with the to_json of
+# dash._callback, which has no hook of its own: it is wrapped to be timed as
+# the "serialization" stage
+def time_serialization():
+    from dash import _callback
+
+    encode = _callback.to_json
+    if getattr(encode, "timed", False):
+        return
+
+    def to_json(value):
+        with stage("serialization"):
+            return encode(value)
+
+    to_json.timed = True
+    _callback.to_json = to_json
+
+
+# Name of the Python function behind a Dash callback request
+def callback_name(app, body):
+    output = (body or {}).get("output", "")
+    callback = app.callback_map.get(output, {}).get("callback")
+    name = getattr(callback, "__name__", None)
+    if name:
+        return name
+
+    return output.split("@")[0] or "unknown"
+
+
+# Record every callback request and expose the histograms at /metrics. With
+# profiling enabled, a request sent with the profile header is run under
+# cProfile and its stats are dumped to config.PROFILE_DIR.
+def instrument(app, server):
+    from flask import Response, g, request
+
+    time_serialization()
+
+    def is_callback():
+        return request.path.endswith("/_dash-update-component")
+
+    @server.before_request
+    def start_callback_metrics():
+        if not is_callback():
+            return
+
+        g.metrics_frame = _enter()
+        g.profiler = None
+        if config.PROFILING and request.headers.get(config.PROFILE_HEADER):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @server.after_request
+    def record_callback_metrics(response):
+        frame = g.pop("metrics_frame", None)
+        if frame is None:
+            return response
+
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+
+        elapsed, allocated = _exit(frame)
+        name = callback_name(app, request.get_json(silent=True))
+        CALLBACK_SECONDS.observe(elapsed, name)
+        CALLBACK_PAYLOAD_BYTES.observe(len(response.get_data()), name)
+        if allocated is not None:
+            CALLBACK_ALLOCATED_BYTES.observe(allocated, name)
+
+        if profiler is not None:
+            os.makedirs(config.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(config.PROFILE_DIR, f"{name}-{time.time_ns()}.prof")
+            profiler.dump_stats(path)
+            # Only the file name: the server's paths are not the client's business
+            response.headers["X-Profile-Dump"] = os.path.basename(path)
+
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,225 @@
+# Import the necessary libraries
+import copy
+import itertools
+import logging
+import os
+import threading
+
+from functions import config, db_utils, shm_utils
+from functions.data_utils import source_info
+from functions.sql_utils import change_marker_query
+
+logger = logging.getLogger(__name__)
+
+
+# Everything the panels read for one version of the data. Snapshots are
+# replaced as a whole, so a callback that started on one never sees a mix of
+# two versions.
+class DataSnapshot:
+    def __init__(
+        self, dataset, aggregates, stats_source, bitmap_index, sample, version=1
+    ):
+        self.dataset = dataset  # raw rows (None under pushdown)
+        self.aggregates = aggregates  # source of the counts
+        self.stats_source = stats_source  # source of the box statistics
+        self.bitmap_index = bitmap_index  # cross-filtering (None under pushdown)
+        self.sample = sample  # stratified sample (None without approximate panels)
+        self.version = version
+
+    # Same sources under a new version (e.g. after rows were appended to them)
+    def replace(self, **changes):
+        snapshot = copy.copy(self)
+        for name, value in changes.items():
+            setattr(snapshot, name, value)
+        return snapshot
+
+
+# Size and modification time of the csv file. A change is only reported once
+# the marker has stayed the same for a whole interval, so that a file still
+# being written is not loaded.
+class FileWatcher:
+    def __init__(self, path=config.CSV_PATH):
+        self.path = path
+        self.marker = self.pending = self.read()
+
+    def read(self):
+        try:
+            info = source_info(self.path)
+        except OSError:  # being replaced, check again next time
+            return getattr(self, "marker", None)
+        return info["size"], info["mtime_ns"]
+
+    def changed(self):
+        marker = self.read()
+        if marker != self.pending:
+            self.pending = marker
+            return False
+
+        changed = marker != self.marker
+        self.marker = marker
+        return changed
+
+
+# Change marker of the stroke_data table (see sql_utils.change_marker_query)
+class TableWatcher(FileWatcher):
+    def __init__(self, backend, query=config.CHANGE_MARKER_QUERY):
+        self.backend = backend
+        self.query = query or change_marker_query(backend.dialect, backend.table)
+        self.marker = self.pending = self.read()
+
+    def read(self):
+        return tuple(map(tuple, self.backend.query(self.query)))
+
+
+# Version of the dataset published by the serving process (see
+# shm_utils.publish_dataset): workers reload when it changes, attaching the
+# new columns instead of loading the data themselves, and use it as their
+# version so that every worker agrees on it
+class SharedWatcher:
+    def __init__(self, path):
+        self.path = path
+        self.version = self.read()
+
+    def read(self):
+        try:
+            return shm_utils.read_descriptor(self.path)["version"]
+        except (OSError, ValueError):  # check again next time
+            return getattr(self, "version", 0)
+
+    def changed(self):
+        # Also close the columns of versions no request uses anymore
+        shm_utils.release_attached()
+
+        version = self.read()
+        changed = version != self.version
+        self.version = version
+        return changed
+
+
+# Watcher of the data source itself
+def source_watcher():
+    if config.DATA_BACKEND == "csv":
+        return FileWatcher()
+
+    return TableWatcher(db_utils.get_backend())
+
+
+# Workers of serve.py follow the dataset the serving process publishes
+def get_watcher():
+    path = os.environ.get(shm_utils.SHM_ENV)
+    if path:
+        return SharedWatcher(path)
+
+    return source_watcher()
+
+
+# Current snapshot of the data, rebuilt in the background when the source
+# changes. A reload builds the new snapshot off the request threads, lets it
+# warm the caches of its version, then swaps it in with a single assignment:
+# requests pinned to the previous snapshot (see install) finish on it.
+class DatasetManager:
+    def __init__(
+        self, load, watcher=None, interval=config.RELOAD_INTERVAL_SECONDS, warm=None
+    ):
+        self.load = load  # (reload, version) -> DataSnapshot
+        self.watcher = watcher
+        self.interval = interval
+        self.warm = warm  # called with a new snapshot pinned, before the swap
+        self.lock = threading.Lock()  # serializes swaps
+        self._versions = itertools.count(1)
+        self._reload_lock = threading.Lock()  # one rebuild at a time
+        self._local = threading.local()
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.snapshot = load(False, next(self._versions))
+
+    # Next version number, or a given larger one (e.g. a published version)
+    def next_version(self, minimum=0):
+        with self.lock:
+            version = max(next(self._versions), minimum)
+            self._versions = itertools.count(version + 1)
+            return version
+
+    # Snapshot pinned to this thread, or the latest one
+    def current(self):
+        return getattr(self._local, "snapshot", None) or self.snapshot
+
+    def pin(self, snapshot=None):
+        previous = getattr(self._local, "snapshot", None)
+        self._local.snapshot = snapshot or self.snapshot
+        return previous
+
+    def unpin(self, previous=None):
+        self._local.snapshot = previous
+
+    # Run a function on a given snapshot (e.g. on a job queue thread)
+    def run_pinned(self, snapshot, func, *args, **kwargs):
+        previous = self.pin(snapshot)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.unpin(previous)
+
+    def swap(self, snapshot):
+        with self.lock:
+            self.snapshot = snapshot
+
+    def reload(self, version=0):
+        with self._reload_lock:
+            snapshot = self.load(True, self.next_version(version))
+            if self.warm is not None:
+                self.run_pinned(snapshot, self.warm)
+            self.swap(snapshot)
+
+        return snapshot
+
+    # Swap in a snapshot derived from the current one, e.g. with ingested rows
+    # (change is called with the current snapshot and a new version). Never
+    # runs during a reload, so neither loses the other's changes.
+    def update(self, change):
+        with self._reload_lock:
+            snapshot = change(self.snapshot, self.next_version())
+            self.swap(snapshot)
+
+        return snapshot
+
+    # Watch the source from a daemon thread. Started on first use: threads do
+    # not survive the fork of the serving workers.
+    def start(self):
+        if self.watcher is None or self.interval <= 0:
+            return
+
+        with self.lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._watch, name="dataset-watcher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.watcher.changed():
+                    self.reload(getattr(self.watcher, "version", 0))
+            except Exception:  # keep serving the current snapshot
+                logger.exception("Reloading the dataset failed")
+
+
+# Pin every request to the snapshot current when it started, and start the
+# watcher in the serving process
+def install(server, manager):
+    from flask import g
+
+    @server.before_request
+    def pin_snapshot():
+        manager.start()
+        g.previous_snapshot = manager.pin()
+
+    @server.teardown_request
+    def unpin_snapshot(error=None):
+        manager.unpin(g.pop("previous_snapshot", None))
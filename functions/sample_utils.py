@@ -0,0 +1,156 @@
+# Import the necessary libraries
+import copy
+
+import numpy as np
+
+from functions.aggregate_utils import AGE_BUCKET_WIDTH, box_stats
+from functions.bitmap_utils import BitmapIndex, FilteredView
+from functions.data_utils import DatasetBuilder
+from functions.db_utils import STROKE_COLUMNS
+from functions.sql_utils import SqlAggregates, sample_query
+
+# z score of the 95% confidence intervals
+CONFIDENCE_Z = 1.96
+
+
+# Sample of the patients stratified by stroke class: each class keeps up to
+# the same number of rows, so the rare stroke-positive class is as well
+# represented as the healthy one. Answers the cube's queries with counts
+# scaled back to the full table, and knows the error bounds of its estimates.
+class StratifiedSample:
+    approximate = True
+
+    def __init__(self, dataset, population, z=CONFIDENCE_Z):
+        self.dataset = dataset  # sampled rows
+        self.population = population  # stroke label -> rows of the full table
+        self.z = z
+        self.index = BitmapIndex(dataset)
+        self.rows = FilteredView(self.index, dataset, {})
+
+        _, sampled_yes, sampled_no = self.rows.stroke_counts()
+        self.sampled = {"Yes": sampled_yes, "No": sampled_no}
+
+    @classmethod
+    def from_dataset(cls, dataset, rows_per_class, seed=0):
+        rng = np.random.default_rng(seed)
+        population = {}
+        keep = []
+
+        for code, label in enumerate(dataset.categories["stroke"]):
+            rows = np.flatnonzero(dataset.codes["stroke"] == code)
+            population[label] = len(rows)
+            if len(rows) > rows_per_class:
+                rows = rng.choice(rows, rows_per_class, replace=False)
+            keep.append(rows)
+
+        return cls(dataset.take(np.sort(np.concatenate(keep))), population)
+
+    @classmethod
+    def from_backend(cls, backend, rows_per_class):
+        # One random draw per stroke class, only the sampled rows are fetched
+        # (the estimates are weighted by the rows actually drawn)
+        _, stroke, no_stroke = SqlAggregates(backend).stroke_counts()
+        population = {"Yes": stroke, "No": no_stroke}
+
+        builder = DatasetBuilder(STROKE_COLUMNS)
+        for label, rows in population.items():
+            query = sample_query(
+                STROKE_COLUMNS, rows_per_class, rows, backend.table, backend.dialect
+            )
+            builder.add_rows(
+                backend.query(query.format(p=backend.placeholder), (label,))
+            )
+
+        return cls(builder.build(), population)
+
+    # Same sample restricted by cross-filters (the weights stay per class)
+    def filter(self, filters):
+        view = copy.copy(self)
+        view.rows = FilteredView(self.index, self.dataset, filters)
+        return view
+
+    # Same sample with rows of the full table added outside of it (e.g.
+    # ingested ones): only the weights change
+    def with_population(self, stroke_values):
+        sample = copy.copy(self)
+        sample.population = dict(self.population)
+        for label in stroke_values:
+            sample.population[label] = sample.population.get(label, 0) + 1
+        return sample
+
+    def _weight(self, stroke_value):
+        sampled = self.sampled.get(stroke_value, 0)
+        if sampled == 0:
+            return 0.0
+
+        return self.population.get(stroke_value, 0) / sampled
+
+    def _estimates(self, counts, stroke_value):
+        return np.round(np.asarray(counts) * self._weight(stroke_value)).astype(
+            np.int64
+        )
+
+    # 95% margin of error of estimated counts of one stroke class (binomial,
+    # with the finite population correction: 0 when the class is fully sampled)
+    def margins(self, counts, stroke_value):
+        sampled = self.sampled.get(stroke_value, 0)
+        population = self.population.get(stroke_value, 0)
+        if sampled == 0 or population <= 1:
+            return np.zeros(len(counts))
+
+        share = np.asarray(counts, dtype=np.float64) / population
+        correction = (population - sampled) / (population - 1)
+        return (
+            self.z
+            * population
+            * np.sqrt(np.clip(share * (1 - share), 0, None) / sampled * correction)
+        )
+
+    def value_counts(self, column, stroke_value):
+        labels, counts = self.rows.value_counts(column, stroke_value)
+        return labels, self._estimates(counts, stroke_value)
+
+    def age_group_counts(self, stroke_value, width=AGE_BUCKET_WIDTH):
+        labels, counts = self.rows.age_group_counts(stroke_value, width)
+        return labels, self._estimates(counts, stroke_value)
+
+    def values(self, column, stroke_value):
+        return self.rows.values(column, stroke_value)
+
+    def box_stats(self, column, stroke_value):
+        values = self.values(column, stroke_value)
+        stats = box_stats(values)
+        if stats is None:
+            return None
+
+        # Quartiles are those of the sample, the count is the estimated one
+        stats["count"] = int(self._estimates([len(values)], stroke_value)[0])
+        stats["sample_count"] = len(values)
+        if self.sampled.get(stroke_value) == self.population.get(stroke_value):
+            stats["median_interval"] = (stats["median"], stats["median"])
+        else:
+            stats["median_interval"] = median_interval(values, self.z)
+
+        return stats
+
+    def mean(self, column, stroke_value):
+        return self.rows.mean(column, stroke_value)
+
+    def stroke_counts(self):
+        _, stroke, no_stroke = self.rows.stroke_counts()
+        stroke = int(self._estimates([stroke], "Yes")[0])
+        no_stroke = int(self._estimates([no_stroke], "No")[0])
+
+        return stroke + no_stroke, stroke, no_stroke
+
+
+# Distribution-free confidence interval of the median: the order statistics
+# around n/2 that bracket it with the given z score
+def median_interval(values, z=CONFIDENCE_Z):
+    n = len(values)
+    half_width = z * np.sqrt(n) / 2
+    low = max(int(np.floor(n / 2 - half_width)), 0)
+    high = min(int(np.ceil(n / 2 + half_width)), n - 1)
+    ordered = np.partition(values, [low, high])
+
+    return float(ordered[low]), float(ordered[high])
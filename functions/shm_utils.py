@@ -0,0 +1,182 @@
+# Import the necessary libraries
+import json
+import os
+import sys
+import tempfile
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from functions.data_utils import StrokeDataset
+
+# Environment variable with the path of the descriptor file through which
+# worker processes find the shared columns. The serving process rewrites the
+# file when it reloads the data (see publish_dataset).
+SHM_ENV = "DASHBOARD_SHM_DESCRIPTOR"
+
+# Segments created or attached by this process (kept alive with the arrays)
+_segments = []
+
+# Names of the segments created by this process, and of those of the latest
+# version it attached
+_exported = set()
+_latest = set()
+
+# Segment names of the versions published by this process, oldest first
+_published = []
+
+# A forked worker did not create the segments it inherits, it may close them
+# (see release_attached)
+os.register_at_fork(after_in_child=_exported.clear)
+
+
+# Copy every column of the dataset into a shared memory segment, return the
+# descriptor workers need to attach to them
+def export_dataset(dataset):
+    columns = {}
+
+    for column in dataset.headers:
+        array = dataset.numeric.get(column)
+        if array is None:
+            array = dataset.codes[column]
+
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+        shared[:] = array
+        _segments.append(segment)
+        _exported.add(segment.name)
+
+        columns[column] = {
+            "name": segment.name,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+
+    return {
+        "headers": dataset.headers,
+        "categories": dataset.categories,
+        "version": dataset.version,
+        "columns": columns,
+        "pid": os.getpid(),
+    }
+
+
+# Dataset whose columns are views over the shared memory segments
+def attach_dataset(descriptor):
+    numeric = {}
+    codes = {}
+
+    for column in descriptor["headers"]:
+        spec = descriptor["columns"][column]
+        segment = attach_segment(spec["name"], descriptor.get("pid"))
+        array = np.ndarray(
+            spec["shape"], dtype=np.dtype(spec["dtype"]), buffer=segment.buf
+        )
+        array.flags.writeable = False
+
+        if column in descriptor["categories"]:
+            codes[column] = array
+        else:
+            numeric[column] = array
+
+    return StrokeDataset(
+        descriptor["headers"],
+        numeric,
+        codes,
+        descriptor["categories"],
+        descriptor["version"],
+    )
+
+
+def attach_segment(name, creator=None):
+    segment = shared_memory.SharedMemory(name=name)
+
+    # Before Python 3.13 attaching registers the segment with the resource
+    # tracker, which would unlink it when this process exits. The creator and
+    # the workers it forked share one tracker, where it is registered already.
+    shared_tracker = creator in (os.getpid(), os.getppid())
+    if sys.version_info < (3, 13) and not shared_tracker:
+        resource_tracker.unregister(segment._name, "shared_memory")
+
+    _segments.append(segment)
+    return segment
+
+
+def segment_names(descriptor):
+    return {spec["name"] for spec in descriptor["columns"].values()}
+
+
+def read_descriptor(path):
+    with open(path, encoding="utf-8") as source:
+        return json.load(source)
+
+
+def write_descriptor(descriptor, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as output:
+        json.dump(descriptor, output)
+    os.replace(tmp_path, path)
+
+
+# Dataset shared by the process that started the workers (its latest
+# version), if any
+def shared_dataset():
+    global _latest
+
+    path = os.environ.get(SHM_ENV)
+    if not path:
+        return None
+
+    descriptor = read_descriptor(path)
+    _latest = segment_names(descriptor)
+    return attach_dataset(descriptor)
+
+
+# Close the attached segments of the versions before the latest one (those
+# still used by in-flight requests are closed by a later call)
+def release_attached():
+    release(keep=_exported | _latest)
+
+
+# Export the dataset and publish its descriptor to child processes
+def share_dataset(dataset):
+    path = os.path.join(tempfile.gettempdir(), f"dashboard-shm-{os.getpid()}.json")
+    os.environ[SHM_ENV] = path
+    descriptor = publish_dataset(dataset)
+
+    return attach_dataset(descriptor)
+
+
+# Export a new version of the dataset and point the workers at it. The
+# segments of older versions than the previous one are unlinked: a worker
+# still reading them keeps its mapping until it attaches a newer version.
+def publish_dataset(dataset):
+    descriptor = export_dataset(dataset)
+    write_descriptor(descriptor, os.environ[SHM_ENV])
+
+    _published.append(segment_names(descriptor))
+    del _published[:-2]
+    release(unlink=True, keep=set().union(*_published))
+
+    return descriptor
+
+
+# Release the segments (and unlink those this process created), except the
+# kept ones. A segment whose arrays are still in use stays open until a later
+# release.
+def release(unlink=False, keep=()):
+    for segment in list(_segments):
+        if segment.name in keep:
+            continue
+
+        if unlink and segment.name in _exported:
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+
+        try:
+            segment.close()
+        except BufferError:
+            continue
+        _segments.remove(segment)
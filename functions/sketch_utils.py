@@ -0,0 +1,153 @@
+# Import the necessary libraries
+import copy
+
+import numpy as np
+
+
+# Mergeable quantile sketch with relative accuracy (DDSketch-style). Positive
+# values fall into logarithmic buckets, so a whole column fits in a few hundred
+# counters; values <= 0 are kept in a single zero bucket.
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+
+        self.counts = np.zeros(0, dtype=np.int64)  # dense positive buckets
+        self.offset = 0  # bucket index of counts[0]
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @classmethod
+    def from_values(cls, values, relative_accuracy=0.01):
+        sketch = cls(relative_accuracy)
+        sketch.add(values)
+        return sketch
+
+    def to_dict(self):
+        empty = self.count == 0
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "counts": self.counts.tolist(),
+            "offset": self.offset,
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": None if empty else self.min,
+            "max": None if empty else self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"])
+        sketch.counts = np.array(data["counts"], dtype=np.int64)
+        sketch.offset = data["offset"]
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            index = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+            low = int(index.min())
+            self._add_buckets(low, np.bincount(index - low))
+
+    # New sketch with another one merged in (this one is left as is)
+    def merged(self, other):
+        sketch = copy.copy(self)
+        sketch.merge(other)
+        return sketch
+
+    def merge(self, other):
+        if not np.isclose(self.gamma, other.gamma):
+            raise ValueError("Cannot merge sketches with different accuracies")
+
+        if len(other.counts):
+            self._add_buckets(other.offset, other.counts)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _add_buckets(self, offset, counts):
+        if len(self.counts) == 0:
+            self.counts, self.offset = counts.astype(np.int64), offset
+            return
+
+        # Grow the dense bucket array to cover both ranges
+        low = min(self.offset, offset)
+        high = max(self.offset + len(self.counts), offset + len(counts))
+        merged = np.zeros(high - low, dtype=np.int64)
+        merged[self.offset - low : self.offset - low + len(self.counts)] += self.counts
+        merged[offset - low : offset - low + len(counts)] += counts
+        self.counts, self.offset = merged, low
+
+    def buckets(self):
+        # Representative value and count of every non-empty bucket, ascending
+        index = np.arange(self.offset, self.offset + len(self.counts))
+        values = 2 * self.gamma**index / (self.gamma + 1)
+        values = np.clip(values, self.min, self.max)
+        counts = self.counts
+        if self.zero_count:
+            values = np.concatenate([[min(self.min, 0.0)], values])
+            counts = np.concatenate([[self.zero_count], counts])
+
+        observed = counts > 0
+        return values[observed], counts[observed]
+
+    def quantiles(self, fractions):
+        values, counts = self.buckets()
+        ranks = np.asarray(fractions) * (self.count - 1)
+
+        return values[np.searchsorted(np.cumsum(counts), ranks, side="right")]
+
+    def box_stats(self, max_outliers=100):
+        if self.count == 0:
+            return None
+
+        q1, median, q3 = self.quantiles([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        values, counts = self.buckets()
+
+        # Whiskers end at the last buckets inside 1.5 IQR
+        inside = (values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)
+        outside_values = values[~inside]
+        outside_counts = counts[~inside]
+
+        # Evenly spaced sample of the outliers (extremes included)
+        n_outliers = int(outside_counts.sum())
+        ranks = np.linspace(0, n_outliers - 1, min(n_outliers, max_outliers))
+        positions = np.searchsorted(
+            np.cumsum(outside_counts), ranks.round(), side="right"
+        )
+
+        return {
+            "q1": float(q1),
+            "median": float(median),
+            "q3": float(q3),
+            "lowerfence": float(values[inside].min()),
+            "upperfence": float(values[inside].max()),
+            "mean": self.sum / self.count,
+            "outliers": outside_values[positions],
+            "count": self.count,
+        }
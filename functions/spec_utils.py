@@ -0,0 +1,161 @@
+# Import the necessary libraries
+from functions.aggregate_utils import AGE_BUCKET_WIDTH
+
+# Box plots either ship every raw value ("raw") or only server-side statistics
+# ("summary"), which keeps the figure payload constant as the table grows
+BOX_MODE = "summary"
+
+# Stroke classes compared side by side in the box plots, and their names
+STROKE_CLASSES = [("No", "Healthy"), ("Yes", "Stroke")]
+
+
+# Declaration of a dashboard panel: what is aggregated, how it is drawn and
+# how it is wired to the page. Figures are built by build_chart, and the
+# panel's caching, filtering and callbacks come from chart_utils.
+class ChartSpec:
+    def __init__(
+        self,
+        name,
+        title,
+        kind,  # "pie", "treemap", "bar" or "box"
+        aggregation,  # "value_counts", "age_group_counts" or "box_stats"
+        column=None,
+        colors=None,  # "registry", stroke value -> color (box plots) or None
+        width=450,
+        height=400,
+        title_x=0.45,
+        axis_titles=None,  # (x axis, y axis)
+        autosize=False,  # None to leave it unset
+        dropdown=None,  # id of the stroke dropdown
+        cross_filter=False,  # clicking a segment filters the other panels
+        heavy=False,  # computed on the job queue
+    ):
+        self.name = name
+        self.title = title
+        self.kind = kind
+        self.aggregation = aggregation
+        self.column = column
+        self.colors = colors
+        self.width = width
+        self.height = height
+        self.title_x = title_x
+        self.axis_titles = axis_titles
+        self.autosize = autosize
+        self.dropdown = dropdown
+        self.cross_filter = cross_filter
+        self.heavy = heavy
+
+    # Column whose filter the panel ignores (a panel never filters itself)
+    @property
+    def filter_column(self):
+        return self.column if self.cross_filter else None
+
+    # Aggregate queries behind the panel, as (aggregation, args)
+    def queries(self, stroke_value=None):
+        if self.aggregation == "box_stats":
+            return [("box_stats", (self.column, value)) for value, _ in STROKE_CLASSES]
+        if self.aggregation == "age_group_counts":
+            return [("age_group_counts", (stroke_value, AGE_BUCKET_WIDTH))]
+
+        return [("value_counts", (self.column, stroke_value))]
+
+    def layout(self):
+        layout = {
+            "title": {
+                "text": self.title,
+                "font": {"size": 24},
+                "x": self.title_x,  # center title
+            }
+        }
+        if self.axis_titles is not None:
+            layout["xaxis_title"], layout["yaxis_title"] = self.axis_titles
+        if self.autosize is not None:
+            layout["autosize"] = self.autosize
+        layout["width"] = self.width
+        layout["height"] = self.height
+
+        return layout
+
+
+# Every panel of the dashboard, by graph id, in page order
+CHARTS = {
+    "gender-pie-chart": ChartSpec(
+        "gender_pie_chart",
+        "Gender",
+        "pie",
+        "value_counts",
+        "gender",
+        colors="registry",
+        dropdown="gender_stroke_val",
+        cross_filter=True,
+    ),
+    "residence-pie-chart": ChartSpec(
+        "residence_pie_chart",
+        "Residence",
+        "pie",
+        "value_counts",
+        "residence_type",
+        colors="registry",
+        dropdown="residence_stroke_val",
+        cross_filter=True,
+    ),
+    "agebar-chart": ChartSpec(
+        "agebar_chart",
+        "Age",
+        "bar",
+        "age_group_counts",
+        "age",
+        width=800,
+        title_x=0.5,
+        axis_titles=("Age Group", "Count"),
+        autosize=None,
+        dropdown="age_stroke_val",
+        heavy=True,
+    ),
+    "stroke-positive-smoker-chart": ChartSpec(
+        "stroke_positive_smoker_chart",
+        "Smoking status",
+        "treemap",
+        "value_counts",
+        "smoking_status",
+        colors="registry",
+        width=500,
+        height=450,
+        dropdown="smoker_stroke_val",
+        cross_filter=True,
+    ),
+    "job-tree-chart": ChartSpec(
+        "job_tree_chart",
+        "Occupation",
+        "pie",
+        "value_counts",
+        "work_type",
+        colors="registry",
+        width=500,
+        height=450,
+        dropdown="job_stroke_val",
+        cross_filter=True,
+    ),
+    "glucose-bar-chart": ChartSpec(
+        "glucose_box_chart",
+        "Avg. glucose levels",
+        "box",
+        "box_stats",
+        "avg_glucose_level",
+        colors={"No": "lightseagreen", "Yes": "indianred"},
+        title_x=0.5,
+        axis_titles=("Patient", "Glucose levels (mg/dL)"),
+        heavy=True,
+    ),
+    "bmi-bar-chart": ChartSpec(
+        "bmi_box_chart",
+        "BMI",
+        "box",
+        "box_stats",
+        "bmi",
+        colors={"No": "lightseagreen", "Yes": "indianred"},
+        title_x=0.5,
+        axis_titles=("Patient", "Body mass index"),
+        heavy=True,
+    ),
+}
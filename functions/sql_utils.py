@@ -0,0 +1,280 @@
+# Import the necessary libraries
+import copy
+
+import numpy as np
+
+from functions.aggregate_utils import (
+    AGE_BUCKET_CAP,
+    AGE_BUCKET_WIDTH,
+    CUBE_DIMENSIONS,
+    AggregateCube,
+)
+from functions.category_utils import CATEGORY_LABELS
+
+# Columns the aggregate queries may group on or summarize
+GROUP_COLUMNS = CUBE_DIMENSIONS
+SUMMARY_COLUMNS = ["age", "avg_glucose_level", "bmi"]
+
+
+# Aggregate queries against stroke_data, only the results leave the database.
+# Each aggregate is a plan: a generator yielding (query, params) and receiving
+# the rows, so the same plans run on blocking connections (here) or on asyncio
+# ones (functions/async_db_utils.py).
+class SqlAggregates:
+    def __init__(self, backend, max_outliers=100):
+        self.backend = backend
+        self.max_outliers = max_outliers
+        self.table = backend.table  # or a filtered subquery of it (see filter)
+
+    def _query(self, sql, params=()):
+        return self.backend.query(sql.format(p=self.backend.placeholder), params)
+
+    def _run(self, plan):
+        rows = None
+        while True:
+            try:
+                sql, params = plan.send(rows)
+            except StopIteration as done:
+                return done.value
+            rows = self._query(sql, params)
+
+    # Same aggregates restricted by cross-filters: every query reads the rows
+    # of the table that match them
+    def filter(self, filters):
+        view = copy.copy(self)
+        view.table = filtered_table(self.table, filters)
+        return view
+
+    def value_counts(self, column, stroke_value):
+        return self._run(self.value_counts_plan(column, stroke_value))
+
+    def age_group_counts(self, stroke_value, width=AGE_BUCKET_WIDTH):
+        return self._run(self.age_group_counts_plan(stroke_value, width))
+
+    def snapshot(self):
+        return self._run(self.snapshot_plan())
+
+    def stroke_counts(self):
+        return self._run(self.stroke_counts_plan())
+
+    def mean(self, column, stroke_value):
+        return self._run(self.mean_plan(column, stroke_value))
+
+    def box_stats(self, column, stroke_value):
+        return self._run(self.box_stats_plan(column, stroke_value))
+
+    def value_counts_plan(self, column, stroke_value):
+        if column not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group on column: {column}")
+
+        rows = yield count_query(column, self.table), (stroke_value,)
+        labels = [row[0] for row in rows]
+        counts = np.array([row[1] for row in rows], dtype=np.int64)
+
+        return labels, counts
+
+    def age_group_counts_plan(self, stroke_value, width=AGE_BUCKET_WIDTH):
+        if AGE_BUCKET_CAP % width:
+            raise ValueError(f"Bucket width {width} does not divide the cap")
+
+        rows = yield age_group_query(width, self.table), (stroke_value,)
+        labels = [
+            (
+                f"{AGE_BUCKET_CAP}+"
+                if bucket * width >= AGE_BUCKET_CAP
+                else f"{bucket * width}-{(bucket + 1) * width}"
+            )
+            for bucket, _ in rows
+        ]
+        counts = np.array([row[1] for row in rows], dtype=np.int64)
+
+        return labels, counts
+
+    def snapshot_plan(self):
+        # Every count-based panel from a single GROUP BY scan of the table
+        rows = yield snapshot_query(self.table), ()
+        return AggregateCube.from_group_counts(rows)
+
+    def stroke_counts_plan(self):
+        rows = yield (
+            f"SELECT stroke, COUNT(*) FROM {self.table} GROUP BY stroke",
+            (),
+        )
+        by_label = dict(rows)
+
+        return sum(by_label.values()), by_label.get("Yes", 0), by_label.get("No", 0)
+
+    def mean_plan(self, column, stroke_value):
+        if column not in SUMMARY_COLUMNS:
+            raise ValueError(f"Cannot summarize column: {column}")
+
+        rows = yield (
+            f"SELECT AVG({column}) FROM {self.table} WHERE stroke = {{p}}",
+            (stroke_value,),
+        )
+        mean = rows[0][0]
+        return None if mean is None else float(mean)
+
+    def box_stats_plan(self, column, stroke_value):
+        if column not in SUMMARY_COLUMNS:
+            raise ValueError(f"Cannot summarize column: {column}")
+        table = self.table
+
+        rows = yield (
+            f"SELECT COUNT({column}), AVG({column}) FROM {table} WHERE stroke = {{p}}",
+            (stroke_value,),
+        )
+        count, mean = rows[0]
+        if count == 0:
+            return None
+
+        q1, median, q3 = yield from self._quantiles_plan(column, stroke_value, count)
+        iqr = q3 - q1
+
+        # Whiskers end at the last data points inside 1.5 IQR
+        rows = yield (
+            f"SELECT MIN({column}), MAX({column}) FROM {table} "
+            f"WHERE stroke = {{p}} AND {column} BETWEEN {{p}} AND {{p}}",
+            (stroke_value, q1 - 1.5 * iqr, q3 + 1.5 * iqr),
+        )
+        lowerfence, upperfence = rows[0]
+
+        # Evenly spaced sample of the outliers: the smallest value of each tile
+        rows = yield (
+            f"SELECT MIN({column}) FROM ("
+            f"SELECT {column}, NTILE({int(self.max_outliers)}) "
+            f"OVER (ORDER BY {column}) AS tile FROM {table} "
+            f"WHERE stroke = {{p}} AND ({column} < {{p}} OR {column} > {{p}})"
+            ") AS outliers GROUP BY tile ORDER BY tile",
+            (stroke_value, lowerfence, upperfence),
+        )
+
+        return {
+            "q1": float(q1),
+            "median": float(median),
+            "q3": float(q3),
+            "lowerfence": float(lowerfence),
+            "upperfence": float(upperfence),
+            "mean": float(mean),
+            "outliers": np.array([row[0] for row in rows], dtype=np.float64),
+            "count": count,
+        }
+
+    def _quantiles_plan(self, column, stroke_value, count):
+        table = self.table
+
+        if self.backend.dialect == "postgres":
+            rows = yield (
+                "SELECT percentile_cont(0.25) WITHIN GROUP (ORDER BY {c}), "
+                "percentile_cont(0.5) WITHIN GROUP (ORDER BY {c}), "
+                "percentile_cont(0.75) WITHIN GROUP (ORDER BY {c}) "
+                "FROM {t} WHERE stroke = {{p}}".format(c=column, t=table),
+                (stroke_value,),
+            )
+            return [float(value) for value in rows[0]]
+
+        # No percentile_cont: interpolate between the two neighbouring ranks
+        quantiles = []
+        for fraction in (0.25, 0.5, 0.75):
+            position = fraction * (count - 1)
+            rows = yield (
+                f"SELECT {column} FROM {table} WHERE stroke = {{p}} "
+                f"ORDER BY {column} LIMIT 2 OFFSET {int(position)}",
+                (stroke_value,),
+            )
+            low = rows[0][0]
+            high = rows[-1][0]
+            quantiles.append(low + (high - low) * (position - int(position)))
+
+        return quantiles
+
+
+# Subquery of the rows matching cross-filters (column -> labels): the values of
+# a column are ORed, the columns ANDed. Only known labels are matched, inlined
+# as literals so that the plans' parameters stay the same.
+def filtered_table(table, filters):
+    conditions = []
+    for column, values in sorted(filters.items()):
+        if column not in CATEGORY_LABELS:
+            raise ValueError(f"Cannot filter on column: {column}")
+
+        labels = [
+            "'{}'".format(value.replace("'", "''"))
+            for value in values
+            if value in CATEGORY_LABELS[column]
+        ]
+        conditions.append(f"{column} IN ({', '.join(labels)})" if labels else "1 = 0")
+
+    if not conditions:
+        return table
+    return f"(SELECT * FROM {table} WHERE {' AND '.join(conditions)}) AS filtered"
+
+
+# Count of each value of a column for one stroke class, most frequent first
+def count_query(column, table):
+    return (
+        f"SELECT {column}, COUNT(*) AS n FROM {table} WHERE stroke = {{p}} "
+        f"GROUP BY {column} ORDER BY n DESC, {column}"
+    )
+
+
+# Count of each (non-empty) age bucket for one stroke class
+def age_group_query(width, table):
+    last = AGE_BUCKET_CAP // width
+    return (
+        f"SELECT bucket, COUNT(*) FROM ("
+        f"SELECT CASE WHEN age >= {AGE_BUCKET_CAP} THEN {last} "
+        f"ELSE age / {int(width)} END AS bucket FROM {table} "
+        "WHERE stroke = {p}"
+        ") AS buckets GROUP BY bucket ORDER BY bucket"
+    )
+
+
+# Random sample of about `rows` rows of one stroke class (of `population`
+# rows), drawn in one scan without sorting the table: postgres keeps each row
+# with the sampling probability (TABLESAMPLE BERNOULLI), SQLite compares a
+# random 63-bit integer with the matching threshold. The LIMIT only caps the
+# memory, the draw seldom reaches it.
+def sample_query(columns, rows, population, table, dialect):
+    select = f"SELECT {', '.join(columns)} FROM {table}"
+    fraction = rows / population if population else 1.0
+    if fraction >= 1:
+        return f"{select} WHERE stroke = {{p}}"
+
+    limit = 2 * int(rows)
+    if dialect == "postgres":
+        return (
+            f"{select} TABLESAMPLE BERNOULLI ({100 * fraction!r}) "
+            f"WHERE stroke = {{p}} LIMIT {limit}"
+        )
+
+    threshold = int(fraction * 2**63)
+    return (
+        f"{select} WHERE stroke = {{p}} "
+        f"AND (RANDOM() & 9223372036854775807) < {threshold} LIMIT {limit}"
+    )
+
+
+# Counts of every stroke x dimension x age combination in one scan
+def snapshot_query(table):
+    columns = ", ".join(["stroke"] + CUBE_DIMENSIONS)
+    return (
+        f"SELECT {columns}, "
+        f"CASE WHEN age >= {AGE_BUCKET_CAP} THEN {AGE_BUCKET_CAP} ELSE age END "
+        f"AS age_bucket, COUNT(*) FROM {table} "
+        f"GROUP BY {columns}, age_bucket"
+    )
+
+
+# Cheap value that changes whenever the table is modified: postgres' row
+# change counters of the table (and its file node, which TRUNCATE replaces),
+# SQLite's row count and largest id
+def change_marker_query(dialect, table):
+    if dialect == "postgres":
+        return (
+            f"SELECT pg_relation_filenode('{table}'::regclass), "
+            "n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables "
+            f"WHERE relid = '{table}'::regclass"
+        )
+
+    return f"SELECT COUNT(*), MAX(id) FROM {table}"
@@ -0,0 +1,101 @@
+# Import the necessary libraries
+import argparse
+import os
+
+import numpy as np
+
+from functions import config, data_utils
+from functions.data_utils import StrokeDataset
+
+# Decimals of the numeric columns in the clean dataset
+NUMERIC_DECIMALS = {"age": 0, "avg_glucose_level": 2, "bmi": 1}
+
+
+# Synthetic stroke_data with the schema and distributions of a real dataset.
+# Rows are drawn from the source (so the categorical columns and their
+# relationship with stroke keep their joint distribution) and the numeric
+# columns are smoothed with gaussian noise (Silverman bandwidth per stroke
+# class), clipped to the observed range.
+class SyntheticStrokeData:
+    def __init__(self, source, seed=None):
+        self.source = source
+        self.rng = np.random.default_rng(seed)
+        self.bandwidths = {}
+
+        for column in NUMERIC_DECIMALS:
+            self.bandwidths[column] = np.zeros(len(source.categories["stroke"]))
+            for code in range(len(source.categories["stroke"])):
+                values = source.numeric[column][source.codes["stroke"] == code]
+                if len(values) > 1:
+                    self.bandwidths[column][code] = (
+                        1.06 * values.std() * len(values) ** -0.2
+                    )
+
+    def chunk(self, n_rows, first_id=0):
+        rows = self.rng.integers(0, len(self.source), n_rows)
+        stroke = self.source.codes["stroke"][rows]
+
+        numeric = {"id": np.arange(first_id, first_id + n_rows, dtype=np.int64)}
+        for column, decimals in NUMERIC_DECIMALS.items():
+            values = self.source.numeric[column]
+            noise = self.rng.standard_normal(n_rows) * self.bandwidths[column][stroke]
+            jittered = np.clip(values[rows] + noise, values.min(), values.max())
+            numeric[column] = jittered.round(decimals).astype(values.dtype)
+
+        codes = {column: codes[rows] for column, codes in self.source.codes.items()}
+
+        return StrokeDataset(
+            self.source.headers, numeric, codes, self.source.categories
+        )
+
+    def chunks(self, n_rows, chunk_size=1_000_000):
+        for first_id in range(0, n_rows, chunk_size):
+            yield self.chunk(min(chunk_size, n_rows - first_id), first_id)
+
+    def dataset(self, n_rows, chunk_size=1_000_000):
+        chunks = list(self.chunks(n_rows, chunk_size))
+        numeric = {
+            column: np.concatenate([chunk.numeric[column] for chunk in chunks])
+            for column in self.source.numeric
+        }
+        codes = {
+            column: np.concatenate([chunk.codes[column] for chunk in chunks])
+            for column in self.source.codes
+        }
+
+        return StrokeDataset(
+            self.source.headers, numeric, codes, self.source.categories
+        )
+
+    def write_csv(self, path, n_rows, chunk_size=1_000_000):
+        # Streamed chunk by chunk, memory use does not depend on n_rows
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as output:
+            for position, chunk in enumerate(self.chunks(n_rows, chunk_size)):
+                chunk.to_frame().to_csv(output, index=False, header=position == 0)
+        os.replace(tmp_path, path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic stroke_data csv from the clean dataset"
+    )
+    parser.add_argument("rows", type=int, help="number of rows, e.g. 1000000")
+    parser.add_argument("output", help="path of the generated .csv file")
+    parser.add_argument("--source", default=config.CSV_PATH)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    return parser.parse_args()
+
+
+# python -m functions.synthetic_utils 10000000 datasets/stroke_10m.csv
+def main():
+    args = parse_args()
+    source = data_utils.load_csv_dataset(args.source, cache_dir=None)
+    SyntheticStrokeData(source, args.seed).write_csv(
+        args.output, args.rows, args.chunk_size
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Production launcher: the dataset is loaded once in the master process and
+# placed in shared memory, then gunicorn forks the workers (preload_app), so
+# memory use does not grow with the number of workers. Reloads also happen in
+# the master, which publishes the new columns to every worker.
+import argparse
+import atexit
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is only needed to serve with several workers
+    BaseApplication = None
+
+from functions import config, data_utils, reload_utils, shm_utils
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the stroke dashboard")
+    parser.add_argument("--bind", default="0.0.0.0:8050")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--timeout", type=int, default=60)
+    return parser.parse_args()
+
+
+if BaseApplication is not None:
+
+    class DashboardApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+# Reload the data when its source changes and publish the new version to the
+# workers (reload_utils.SharedWatcher): they attach it instead of each loading
+# the data, and all serve it under the same version number
+def publish_reloads(watcher, interval=config.RELOAD_INTERVAL_SECONDS):
+    from functions import chart_utils
+
+    versions = itertools.count(chart_utils.datasets.snapshot.version + 1)
+    while True:
+        time.sleep(interval)
+        try:
+            if not watcher.changed():
+                continue
+
+            dataset = data_utils.load_dataset()
+            dataset.version = next(versions)
+            shm_utils.publish_dataset(dataset)
+
+            # Workers forked from now on start from the new version
+            chart_utils.datasets.reload(dataset.version)
+        except Exception:  # keep publishing the current version
+            logger.exception("Reloading the dataset failed")
+
+
+def main():
+    if BaseApplication is None:
+        raise SystemExit("gunicorn is required: pip install gunicorn")
+
+    args = parse_args()
+
+    # Load once in the master and share the columns with every worker
+    dataset = shm_utils.share_dataset(data_utils.get_dataset())
+    data_utils.set_dataset(dataset)
+    atexit.register(shm_utils.release, unlink=True)
+
+    # Rows posted to /api/ingest would only reach one worker
+    config.WORKERS = args.workers
+
+    # Import after the dataset is shared so the app picks up the shared handle
+    from dash_app import server
+
+    if config.RELOAD_INTERVAL_SECONDS > 0:
+        threading.Thread(
+            target=publish_reloads,
+            args=(reload_utils.source_watcher(),),
+            name="dataset-publisher",
+            daemon=True,
+        ).start()
+
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "timeout": args.timeout,
+        "preload_app": True,
+        "worker_class": "gthread",
+    }
+    DashboardApplication(server, options).run()
+
+
+if __name__ == "__main__":
+    main()